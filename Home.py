@@ -1,22 +1,14 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
+import os
+from concurrent import futures
 from datetime import date
 
-st.set_page_config(page_title="Sales Dashboard", page_icon="💼", layout="wide")
-
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    # Convert Date column to datetime
-    df["Date"] = pd.to_datetime(df["Date"])
-    # Convert Margin % to a numeric value (remove '%')
-    df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
-    return df
+import streamlit as st
 
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
 
-df = load_data("dummy_sales_data.csv")
+st.set_page_config(page_title="Sales Dashboard", page_icon="💼", layout="wide")
+start_rerun("home")
 
 # Title and Intro
 st.markdown(
@@ -36,35 +28,60 @@ st.sidebar.write(
     "Select the date range, product categories, and customer segments to filter the data."
 )
 
-# Date Range Filter
-min_date = df["Date"].min()
-max_date = df["Date"].max()
-start_date, end_date = st.sidebar.slider(
-    "Select Date Range:",
-    min_value=min_date.to_pydatetime().date(),
-    max_value=max_date.to_pydatetime().date(),
-    value=(min_date.to_pydatetime().date(), max_date.to_pydatetime().date()),
-)
+total_rows = attach_data()
 
-# Filter data based on date range
-filtered_df = df[
-    (df["Date"] >= pd.to_datetime(start_date))
-    & (df["Date"] <= pd.to_datetime(end_date))
-]
+# Imported once the shell above is on screen
+import altair as alt
+
+import engine
+import filter_state
+import jobs
+import sampling
+import trends
+import warmup
+from export import render_export_panel
+
+# Optionally serve the metrics API from this process so it shares the
+# engine's caches with the dashboard
+if os.environ.get("DASHBOARD_API_PORT"):
+    import metrics_api
+
+    metrics_api.serve_in_background(port=int(os.environ["DASHBOARD_API_PORT"]))
+
+# Warm-up progress, shown only while the background warmer is still running
+warmup_status = warmup.status()
+if warmup_status["state"] == "running":
+    st.sidebar.caption(
+        f"Warming caches: {warmup_status['done']}/{warmup_status['total']} views "
+        f"({warmup_status['elapsed_s']:.1f}s)"
+    )
+
+# Filters are shared with the other pages
+filter_state.init()
+
+# Date Range Filter
+start_date, end_date = filter_state.date_range()
 
 # Category Filter
-categories = sorted(list(df["Product Category"].unique()))
-selected_categories = st.sidebar.multiselect(
-    "Choose Product Categories", categories, default=categories
+selected_categories = filter_state.multiselect(
+    "Product Category", "Choose Product Categories"
 )
-filtered_df = filtered_df[filtered_df["Product Category"].isin(selected_categories)]
 
 # Segment Filter
-segments = sorted(list(df["Customer Segment"].unique()))
-selected_segments = st.sidebar.multiselect(
-    "Choose Customer Segments", segments, default=segments
+selected_segments = filter_state.multiselect(
+    "Customer Segment", "Choose Customer Segments"
 )
-filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments)]
+
+filters = engine.make_filters(
+    start_date, end_date, categories=selected_categories, segments=selected_segments
+)
+
+# Fast preview answers from a stratified sample first and swaps in the exact
+# numbers once they have been computed in the background
+fast_preview = filter_state.fast_preview()
+
+# Period-over-period deltas on the KPI cards
+comparison = filter_state.comparison()
 
 # st.markdown(f"**Date Range:** {start_date} to {end_date}")
 # st.markdown(
@@ -76,11 +93,6 @@ filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments
 
 # st.markdown("---")
 
-# High-level Metrics
-total_sales = filtered_df["Total Sales"].sum() if not filtered_df.empty else 0
-total_margin = filtered_df["Margin"].sum() if not filtered_df.empty else 0
-avg_margin_pct = filtered_df["Margin %"].mean() if not filtered_df.empty else 0
-
 # Use custom CSS for background and text color
 st.markdown(
     """
@@ -106,131 +118,230 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-# Display metrics in three columns
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    st.markdown(
-        f"""
-        <div class="metrics-container">
-            <h3>Total Sales</h3>
-            <p>${total_sales:,.2f}</p>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-with col2:
-    st.markdown(
-        f"""
-        <div class="metrics-container">
-            <h3>Total Margin</h3>
-            <p>${total_margin:,.2f}</p>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+status_slot = st.empty()
 
-with col3:
-    st.markdown(
-        f"""
-        <div class="metrics-container">
-            <h3>Average Margin %</h3>
-            <p>{avg_margin_pct:.2f}%</p>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+# Display metrics in three columns
+metric_slots = [col.empty() for col in st.columns(3)]
 
 st.markdown("---")
 
 # Charts Layout
 chart_col1, chart_col2 = st.columns(2)
 chart_col3, chart_col4 = st.columns(2)
+chart_slots = {
+    "sales_over_time": chart_col1.empty(),
+    "sales_by_category": chart_col2.empty(),
+    "sales_by_state": chart_col3.empty(),
+    "sales_by_segment": chart_col4.empty(),
+}
+breakdowns = {
+    "sales_by_category": "Product Category",
+    "sales_by_state": "State",
+    "sales_by_segment": "Customer Segment",
+}
+
+
+def render_metrics(metrics, errors=None):
+    cards = [
+        ("Total Sales", "total_sales", "${:,.2f}"),
+        ("Total Margin", "total_margin", "${:,.2f}"),
+        ("Average Margin %", "avg_margin_pct", "{:.2f}%"),
+    ]
+    changes = engine.kpi_changes(metrics, previous_metrics)
+    for slot, (title, key, fmt) in zip(metric_slots, cards):
+        value = fmt.format(metrics[key])
+        if errors is not None:
+            value = f"≈ {value}<br><small>± {fmt.format(errors[key])} (95%)</small>"
+        if comparison != "None":
+            change = filter_state.format_change(changes, key, comparison)
+            value += f"<br><small>{change}</small>"
+        slot.markdown(
+            f"""
+            <div class="metrics-container">
+                <h3>{title}</h3>
+                <p>{value}</p>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
+
+
+def error_bounds(data):
+    return data.assign(
+        Low=data["Total Sales"] - data["Error"],
+        High=data["Total Sales"] + data["Error"],
+    )
 
-# Sales Over Time
-if not filtered_df.empty:
-    sales_over_time = filtered_df.groupby("Date", as_index=False)["Total Sales"].sum()
 
+def sales_over_time_chart(data):
     line_chart = (
-        alt.Chart(sales_over_time)
+        alt.Chart(data)
         .mark_line(point=True)
         .encode(
             x="Date:T",
             y="Total Sales:Q",
             tooltip=["Date", alt.Tooltip("Total Sales:Q", format="$.2f")],
         )
-        .properties(title="📈 Sales Over Time", width="container", height=300)
+    )
+    if "Error" in data:
+        band = (
+            alt.Chart(error_bounds(data))
+            .mark_area(opacity=0.25)
+            .encode(x="Date:T", y="Low:Q", y2="High:Q")
+        )
+        line_chart = alt.layer(band, line_chart)
+    else:
+        # Mark days that broke from the line's rolling trend
+        flagged = trends.flag_series(data, [])
+        anomaly_points = (
+            alt.Chart(flagged[flagged["Anomaly"]])
+            .mark_point(color="red", size=90, filled=True)
+            .encode(
+                x="Date:T",
+                y="Total Sales:Q",
+                tooltip=[
+                    "Date",
+                    alt.Tooltip("Total Sales:Q", format="$.2f"),
+                    alt.Tooltip("Rolling Mean:Q", format="$.2f"),
+                    alt.Tooltip("Z-Score:Q", format=".2f"),
+                    alt.Tooltip("WoW %:Q", format=".1f"),
+                ],
+            )
+        )
+        line_chart = alt.layer(line_chart, anomaly_points)
+    return line_chart.properties(
+        title="📈 Sales Over Time", width="container", height=300
     )
 
-    chart_col1.altair_chart(line_chart, use_container_width=True)
-else:
-    chart_col1.write("No data available for the selected filters.")
 
-# Sales by Product Category
-if not filtered_df.empty:
-    sales_by_category = filtered_df.groupby("Product Category", as_index=False)[
-        "Total Sales"
-    ].sum()
+def sales_by_category_chart(data):
+    # Explicit order so the error bars share the bars' axis
+    order = data.sort_values("Total Sales", ascending=False)["Product Category"]
     bar_chart_category = (
-        alt.Chart(sales_by_category)
+        alt.Chart(data)
         .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5)
         .encode(
             x=alt.X("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
-            y=alt.Y("Product Category:N", sort="-x"),
+            y=alt.Y("Product Category:N", sort=order.tolist()),
             color=alt.Color("Product Category:N", legend=None),
             tooltip=[
                 alt.Tooltip("Product Category:N"),
                 alt.Tooltip("Total Sales:Q", format="$,.2f"),
             ],
         )
-        .properties(title="📦 Sales by Product Category", width="container", height=300)
     )
-
-    chart_col2.altair_chart(bar_chart_category, use_container_width=True)
-else:
-    chart_col2.write("No data available for the selected filters.")
-
-# Sales by State
-if not filtered_df.empty:
-    sales_by_state = filtered_df.groupby("State", as_index=False)["Total Sales"].sum()
-    bar_chart_state = (
-        alt.Chart(sales_by_state)
-        .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5, color="teal")
-        .encode(
-            x="State:N",
-            y=alt.Y("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
-            tooltip=[
-                alt.Tooltip("State:N"),
-                alt.Tooltip("Total Sales:Q", format="$,.2f"),
-            ],
+    if "Error" in data:
+        error_bars = (
+            alt.Chart(error_bounds(data))
+            .mark_rule(color="black")
+            .encode(
+                x="Low:Q",
+                x2="High:Q",
+                y=alt.Y("Product Category:N", sort=order.tolist()),
+            )
         )
-        .properties(title="🏙️ Sales by State", width="container", height=300)
+        bar_chart_category = alt.layer(bar_chart_category, error_bars)
+    return bar_chart_category.properties(
+        title="📦 Sales by Product Category", width="container", height=300
     )
 
-    chart_col3.altair_chart(bar_chart_state, use_container_width=True)
-else:
-    chart_col3.write("No data available for the selected filters.")
-
-# Sales by Customer Segment
-if not filtered_df.empty:
-    sales_by_segment = filtered_df.groupby("Customer Segment", as_index=False)[
-        "Total Sales"
-    ].sum()
-    bar_chart_segment = (
-        alt.Chart(sales_by_segment)
-        .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5, color="orange")
+
+def vertical_bar_chart(data, column, color, title):
+    bar_chart = (
+        alt.Chart(data)
+        .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5, color=color)
         .encode(
-            x="Customer Segment:N",
+            x=f"{column}:N",
             y=alt.Y("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
             tooltip=[
-                alt.Tooltip("Customer Segment:N"),
+                alt.Tooltip(f"{column}:N"),
                 alt.Tooltip("Total Sales:Q", format="$,.2f"),
             ],
         )
-        .properties(title="🎯 Sales by Customer Segment", width="container", height=300)
     )
+    if "Error" in data:
+        error_bars = (
+            alt.Chart(error_bounds(data))
+            .mark_rule(color="black")
+            .encode(x=f"{column}:N", y="Low:Q", y2="High:Q")
+        )
+        bar_chart = alt.layer(bar_chart, error_bars)
+    return bar_chart.properties(title=title, width="container", height=300)
+
+
+chart_builders = {
+    "sales_over_time": sales_over_time_chart,
+    "sales_by_category": sales_by_category_chart,
+    "sales_by_state": lambda data: vertical_bar_chart(
+        data, "State", "teal", "🏙️ Sales by State"
+    ),
+    "sales_by_segment": lambda data: vertical_bar_chart(
+        data, "Customer Segment", "orange", "🎯 Sales by Customer Segment"
+    ),
+}
+
+
+def render_chart(name, data):
+    # data carries an "Error" column when it is a sample estimate
+    slot = chart_slots[name]
+    with stage(f"render.{name}"):
+        if data.empty:
+            slot.write("No data available for the selected filters.")
+        else:
+            slot.altair_chart(chart_builders[name](data), use_container_width=True)
+
+
+previous_metrics = None
+if comparison != "None":
+    with stage("aggregate.comparison"):
+        previous_metrics = engine.previous_kpis(filters, comparison)
+
+# The aggregations run on the shared job pool and each card or chart is drawn
+# as soon as its result is in, the KPI cards first as they are the cheapest.
+# Leaving the block, as happens when a newer rerun interrupts this one, drops
+# the jobs no other session is waiting for.
+with jobs.Batch() as batch:
+    pending = {
+        "metrics": batch.submit(engine.kpis, filters),
+        "sales_over_time": batch.submit(engine.sales_over_time, filters),
+        **{
+            name: batch.submit(engine.sales_by, column, filters)
+            for name, column in breakdowns.items()
+        },
+    }
+    status = "Computing results"
+    if fast_preview:
+        # If the exact results aren't ready almost immediately, draw estimates
+        # first and swap in each exact result as it arrives
+        futures.wait(pending.values(), timeout=sampling.PREVIEW_WAIT_S)
+        if not all(job.done() for job in pending.values()):
+            with stage("aggregate.preview") as s:
+                metrics, errors, estimated_rows = sampling.kpis_estimate(filters)
+                estimates = {
+                    "sales_over_time": sampling.sales_over_time_estimate(filters),
+                    **{
+                        name: sampling.sales_by_estimate(column, filters)
+                        for name, column in breakdowns.items()
+                    },
+                }
+                s["rows_out"] = estimated_rows
+            render_metrics(metrics, errors)
+            for name, data in estimates.items():
+                render_chart(name, data)
+            status = (
+                f"⚡ Preview from a {sampling.SAMPLE_FRACTION:.0%} stratified "
+                "sample with 95% error bounds. Computing exact results"
+            )
+    for name, result in batch.as_completed(pending, status_slot, status):
+        if name == "metrics":
+            render_metrics(result)
+        else:
+            render_chart(name, result)
+
+st.markdown("---")
+
+with stage("aggregate.anomalies") as s:
+    s["rows_out"] = len(trends.render_anomaly_table(filters))
 
-    chart_col4.altair_chart(bar_chart_segment, use_container_width=True)
-else:
-    chart_col4.write("No data available for the selected filters.")
+render_export_panel(filters, "home")
+render_debug_panel()
@@ -0,0 +1,453 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+from dataclasses import replace
+from datetime import datetime
+
+import altair as alt
+import pandas as pd
+import plotly.express as px
+
+import engine
+import planner
+from generatedata import generate_data
+
+# Dataset sizes used when none are given on the command line
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000, 10_000_000]
+# Stage kinds of the raw filter + groupby pipeline. Pages answer through the
+# planner instead, so page totals count the "planned" stages and these are
+# totalled separately for comparison.
+RAW_KINDS = {"filter", "groupby"}
+
+
+class StageTimer:
+    def __init__(self, repeat=1):
+        self.repeat = repeat
+        self.stages = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        # Run a stage `repeat` times and keep the result of the last run
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+        rows_out = len(result) if isinstance(result, pd.DataFrame) else None
+        self.stages[name] = {
+            "min_s": min(timings),
+            "median_s": statistics.median(timings),
+            "rows_out": rows_out,
+        }
+        return result
+
+    def page_totals(self, raw=False):
+        # Sum the median time of the stages belonging to each page, on the
+        # planned path the pages run or, with raw=True, the raw pipeline
+        totals = {}
+        for name, stage in self.stages.items():
+            page, kind = (name.split(".") + [""])[:2]
+            if (kind == "planned" and raw) or (kind in RAW_KINDS and not raw):
+                continue
+            totals[page] = totals.get(page, 0.0) + stage["median_s"]
+        return totals
+
+
+# The benchmark calls the engine's uncached building blocks directly so repeated
+# runs measure the work itself rather than cache hits
+
+
+def apply_filters(df, filters):
+    return df[engine.filter_mask(df, filters)]
+
+
+def sum_by(df, by):
+    return engine.sum_sales_by(df, by)
+
+
+def execute_planned(query, file_path):
+    # The engine caches matching row positions per filter; they are cleared
+    # so a scan is timed in full on every repeat, as for a new selection.
+    # The pre-aggregates stay built, as they do in a running dashboard.
+    engine.filtered_index.cache_clear()
+    engine.partition_index.cache_clear()
+    return planner.execute(query, file_path)
+
+
+def run_planned(timer, name, file_path, group_by, filters, freq="D"):
+    # An aggregate as the pages compute it since the query planner: from
+    # prefix sums, the daily cube, bitmaps or a scan, whichever is cheapest
+    query = planner.Query(group_by, filters, freq)
+    result = timer.run(name, execute_planned, query, file_path)
+    timer.stages[name]["source"] = planner.plan(query, file_path)[0]
+    return result
+
+
+def build_prefix_sums(file_path):
+    planner.prefix_sums.cache_clear()
+    return planner.prefix_sums(file_path)
+
+
+# make_filters() arguments of the dimensions the pages filter on
+FILTER_ARGUMENTS = {"category": "categories", "segment": "segments", "state": "states"}
+
+
+def altair_spec(chart):
+    return json.dumps(chart.to_dict())
+
+
+def plotly_spec(fig):
+    return fig.to_json()
+
+
+def bar_chart(data, x, y):
+    return (
+        alt.Chart(data)
+        .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5)
+        .encode(x=x, y=y, tooltip=[x, y])
+        .properties(width="container", height=300)
+    )
+
+
+def line_chart(data, x, y, color=None):
+    encoding = {"x": x, "y": y, "tooltip": [x, y]}
+    if color:
+        encoding["color"] = color
+    return (
+        alt.Chart(data)
+        .mark_line()
+        .encode(**encoding)
+        .properties(width="container", height=300)
+    )
+
+
+def apply_sidebar_filters(timer, page, df, dimensions=("category", "segment")):
+    # The date range and the page's dimension filters (engine.DIMENSIONS
+    # names) with everything selected, as on a fresh page load. Returns the
+    # filtered rows and the combined Filters for the planned stages.
+    start_date, end_date = df["Date"].min(), df["Date"].max()
+    selections = {
+        FILTER_ARGUMENTS[dimension]: sorted(df[engine.DIMENSIONS[dimension]].unique())
+        for dimension in dimensions
+    }
+
+    filtered_df = timer.run(
+        f"{page}.filter.date",
+        apply_filters,
+        df,
+        engine.make_filters(start_date, end_date),
+    )
+    for dimension in dimensions:
+        argument = FILTER_ARGUMENTS[dimension]
+        filtered_df = timer.run(
+            f"{page}.filter.{dimension}",
+            apply_filters,
+            filtered_df,
+            engine.make_filters(**{argument: selections[argument]}),
+        )
+    return filtered_df, engine.make_filters(start_date, end_date, **selections)
+
+
+def bench_home(timer, df, file_path):
+    filtered_df, filters = apply_sidebar_filters(timer, "home", df)
+
+    sales_over_time = timer.run("home.groupby.date", sum_by, filtered_df, "Date")
+    by_category = timer.run(
+        "home.groupby.category", sum_by, filtered_df, "Product Category"
+    )
+    by_state = timer.run("home.groupby.state", sum_by, filtered_df, "State")
+    by_segment = timer.run(
+        "home.groupby.segment", sum_by, filtered_df, "Customer Segment"
+    )
+
+    run_planned(timer, "home.planned.kpis", file_path, (), filters)
+    run_planned(timer, "home.planned.date", file_path, ("Date",), filters)
+    for name, column in [
+        ("category", "Product Category"),
+        ("state", "State"),
+        ("segment", "Customer Segment"),
+    ]:
+        run_planned(timer, f"home.planned.{name}", file_path, (column,), filters)
+
+    timer.run(
+        "home.render.sales_over_time",
+        altair_spec,
+        line_chart(sales_over_time, "Date:T", "Total Sales:Q"),
+    )
+    timer.run(
+        "home.render.category",
+        altair_spec,
+        bar_chart(by_category, "Total Sales:Q", "Product Category:N"),
+    )
+    timer.run(
+        "home.render.state",
+        altair_spec,
+        bar_chart(by_state, "State:N", "Total Sales:Q"),
+    )
+    timer.run(
+        "home.render.segment",
+        altair_spec,
+        bar_chart(by_segment, "Customer Segment:N", "Total Sales:Q"),
+    )
+
+
+def bench_top_customers(timer, df, file_path):
+    top_sales = timer.run(
+        "top_customers.nlargest.sales", lambda: df.nlargest(5, "Total Sales")
+    )
+    top_margin = timer.run(
+        "top_customers.nlargest.margin", lambda: df.nlargest(5, "Margin")
+    )
+
+    timer.run(
+        "top_customers.render.sales",
+        plotly_spec,
+        px.bar(top_sales, x="Total Sales", y="Customer Name", orientation="h"),
+    )
+    timer.run(
+        "top_customers.render.margin",
+        plotly_spec,
+        px.bar(top_margin, x="Margin", y="Customer Name", orientation="h"),
+    )
+
+
+def bench_compare_sales(timer, df, file_path):
+    filtered_df, filters = apply_sidebar_filters(timer, "compare_sales", df)
+
+    # Compare the first two states, as a user picking from the select boxes would
+    states = sorted(filtered_df["State"].unique())[:2]
+    for n, state in enumerate(states, start=1):
+        state_df = timer.run(
+            f"compare_sales.filter.state{n}",
+            apply_filters,
+            filtered_df,
+            engine.make_filters(states=[state]),
+        )
+        over_time = timer.run(
+            f"compare_sales.groupby.date{n}", sum_by, state_df, "Date"
+        )
+        by_category = timer.run(
+            f"compare_sales.groupby.category{n}",
+            sum_by,
+            state_df,
+            "Product Category",
+        )
+        state_filters = replace(filters, states=(state,))
+        for name, group_by in [
+            ("kpis", ()),
+            ("date", ("Date",)),
+            ("category", ("Product Category",)),
+        ]:
+            run_planned(
+                timer,
+                f"compare_sales.planned.{name}{n}",
+                file_path,
+                group_by,
+                state_filters,
+            )
+        timer.run(
+            f"compare_sales.render.date{n}",
+            altair_spec,
+            line_chart(over_time, "Date:T", "Total Sales:Q"),
+        )
+        timer.run(
+            f"compare_sales.render.category{n}",
+            altair_spec,
+            bar_chart(by_category, "Total Sales:Q", "Product Category:N"),
+        )
+
+
+def bench_top_performers(timer, df, file_path):
+    filtered_df, filters = apply_sidebar_filters(timer, "top_performers", df)
+
+    top_products = timer.run(
+        "top_performers.groupby.product",
+        lambda: sum_by(filtered_df, "Product Sub-Category")
+        .sort_values("Total Sales", ascending=False)
+        .head(5),
+    )
+    top_segments = timer.run(
+        "top_performers.groupby.segment",
+        lambda: sum_by(filtered_df, "Customer Segment")
+        .sort_values("Total Sales", ascending=False)
+        .head(5),
+    )
+    run_planned(
+        timer,
+        "top_performers.planned.product",
+        file_path,
+        ("Product Sub-Category",),
+        filters,
+    )
+    run_planned(
+        timer,
+        "top_performers.planned.segment",
+        file_path,
+        ("Customer Segment",),
+        filters,
+    )
+
+    timer.run(
+        "top_performers.render.product",
+        altair_spec,
+        bar_chart(top_products, "Total Sales:Q", "Product Sub-Category:N"),
+    )
+    timer.run(
+        "top_performers.render.segment",
+        altair_spec,
+        bar_chart(top_segments, "Total Sales:Q", "Customer Segment:N"),
+    )
+
+
+def bench_sales_by_category(timer, df, file_path):
+    # The page filters on segment and state; categories are its series
+    filtered_df, filters = apply_sidebar_filters(
+        timer, "sales_by_category", df, ("segment", "state")
+    )
+
+    for freq, period in [("daily", "D"), ("monthly", "M"), ("quarterly", "Q")]:
+
+        def group_by_period():
+            grouped = engine.sum_sales_by_period(
+                filtered_df, "Product Category", period
+            )
+            return grouped.assign(
+                Value=grouped.groupby("Product Category", observed=True)[
+                    "Total Sales"
+                ].cumsum()
+            )
+
+        grouped = timer.run(f"sales_by_category.groupby.{freq}", group_by_period)
+        run_planned(
+            timer,
+            f"sales_by_category.planned.{freq}",
+            file_path,
+            ("Product Category", "Period"),
+            filters,
+            period,
+        )
+        timer.run(
+            f"sales_by_category.render.{freq}",
+            altair_spec,
+            line_chart(grouped, "Period:T", "Value:Q", color="Product Category:N"),
+        )
+
+
+def bench_map(timer, df, file_path):
+    filtered_df, filters = apply_sidebar_filters(timer, "map", df, ("category",))
+
+    state_sales = timer.run(
+        "map.groupby.state",
+        sum_by,
+        filtered_df,
+        "State",
+    )
+    run_planned(timer, "map.planned.state", file_path, ("State",), filters)
+    timer.run(
+        "map.render.choropleth",
+        plotly_spec,
+        px.choropleth(
+            state_sales,
+            locations="State",
+            locationmode="USA-states",
+            color="Total Sales",
+            scope="usa",
+        ),
+    )
+
+
+PAGES = [
+    bench_home,
+    bench_top_customers,
+    bench_compare_sales,
+    bench_top_performers,
+    bench_sales_by_category,
+    bench_map,
+]
+
+
+def dataset_path(data_dir, rows):
+    # Generate each dataset once and reuse it across runs
+    os.makedirs(data_dir, exist_ok=True)
+    file_path = os.path.join(data_dir, f"sales_{rows}.csv")
+    if not os.path.exists(file_path):
+        print(f"Generating {rows:,} rows -> {file_path}")
+        generate_data(file_path, rows)
+    return file_path
+
+
+def run_benchmark(sizes, data_dir="bench_data", repeat=1, budget=None):
+    results = []
+    for rows in sizes:
+        file_path = dataset_path(data_dir, rows)
+        timer = StageTimer(repeat)
+        df = timer.run("load.load_data", engine.read_sales, file_path)
+        # The pre-aggregates the planner answers from, built once per dataset
+        # by a running dashboard
+        timer.run("load.daily_cube", engine.build_cube, df)
+        engine.daily_cube(file_path)
+        timer.run("load.prefix_sums", build_prefix_sums, file_path)
+        for bench_page in PAGES:
+            bench_page(timer, df, file_path)
+
+        page_totals = timer.page_totals()
+        over_budget = (
+            sorted(page for page, total in page_totals.items() if total > budget)
+            if budget is not None
+            else []
+        )
+        results.append(
+            {
+                "rows": rows,
+                "memory": engine.memory_reports().get(file_path),
+                "stages": timer.stages,
+                "page_totals_s": page_totals,
+                "raw_page_totals_s": timer.page_totals(raw=True),
+                "pages_over_budget": over_budget,
+            }
+        )
+        print(
+            f"{rows:>12,} rows: "
+            + ", ".join(f"{page}={total:.3f}s" for page, total in page_totals.items())
+        )
+
+    # The first dataset size at which each page exceeded the budget
+    first_over_budget = {}
+    for result in results:
+        for page in result["pages_over_budget"]:
+            first_over_budget.setdefault(page, result["rows"])
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "altair": alt.__version__,
+        "repeat": repeat,
+        "budget_s": budget,
+        "first_over_budget": first_over_budget,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the load, filter, aggregate and render stages of each page."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--data-dir", default="bench_data")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="Per-page time budget in seconds used to flag slow pages.",
+    )
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.data_dir, args.repeat, args.budget)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,24 @@
+import random
+
+import pytest
+
+import engine
+from generatedata import generate_data
+
+# Tests import the dashboard's top-level modules; this file puts the repo root
+# on sys.path for them
+
+
+@pytest.fixture(scope="session")
+def sales_csv(tmp_path_factory):
+    random.seed(0)
+    file_path = str(tmp_path_factory.mktemp("data") / "sales.csv")
+    generate_data(file_path, 3000)
+    return file_path
+
+
+@pytest.fixture(scope="session")
+def sales_partitions(sales_csv, tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("partitions"))
+    engine.write_partitions(engine.read_sales(sales_csv), out_dir)
+    return out_dir
@@ -0,0 +1,282 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+# Customer dimension: one row per customer with first/last order date, order
+# count, sales and margin, plus the segment and state of their latest order.
+# For partitioned data it is stored next to the partitions and updated by
+# ingest.py and deltas.py; otherwise it is derived on load.
+STORE_FILE = "_customers.parquet"
+ACTIVITY_FILE = "_customer_months.parquet"
+LATEST_COLUMNS = ["Customer Segment", "State"]
+
+# RFM buckets, first match wins. R, F and M are quintile scores from 1 (worst)
+# to 5 (best).
+RFM_BUCKETS = [
+    ("Champions", lambda r, f: (r >= 4) & (f >= 4)),
+    ("Loyal", lambda r, f: (r >= 3) & (f >= 3)),
+    ("New", lambda r, f: (r >= 4) & (f <= 2)),
+    ("At risk", lambda r, f: (r <= 2) & (f >= 3)),
+    ("Hibernating", lambda r, f: (r <= 2) & (f <= 2)),
+]
+OTHER_BUCKET = "Needs attention"
+
+
+def _summarize(df, latest_by, aggregations):
+    grouped = df.groupby("Customer Name", observed=True)
+    latest = df.loc[
+        grouped[latest_by].idxmax(), ["Customer Name"] + LATEST_COLUMNS
+    ].set_index("Customer Name")
+    return grouped.agg(**aggregations).join(latest).reset_index()
+
+
+def aggregate_orders(df):
+    # One groupby pass over a frame of orders
+    return _summarize(
+        df,
+        "Date",
+        {
+            "First Order": ("Date", "min"),
+            "Last Order": ("Date", "max"),
+            "Orders": ("Date", "size"),
+            "Total Sales": ("Total Sales", "sum"),
+            "Margin": ("Margin", "sum"),
+        },
+    )
+
+
+def merge_aggregates(frames):
+    # Combine aggregates of disjoint sets of orders
+    return _summarize(
+        engine.concat_frames(frames),
+        "Last Order",
+        {
+            "First Order": ("First Order", "min"),
+            "Last Order": ("Last Order", "max"),
+            "Orders": ("Orders", "sum"),
+            "Total Sales": ("Total Sales", "sum"),
+            "Margin": ("Margin", "sum"),
+        },
+    )
+
+
+def order_months(df):
+    # The months each customer ordered in, for the retention cohorts
+    return pd.DataFrame(
+        {
+            "Customer Name": df["Customer Name"],
+            "Month": df["Date"].dt.to_period("M").dt.to_timestamp(),
+        }
+    ).drop_duplicates(ignore_index=True)
+
+
+def merge_months(frames):
+    return engine.concat_frames(frames).drop_duplicates(ignore_index=True)
+
+
+def _quintile(values):
+    # 1-5 by rank; tied customers share the higher score
+    ranks = values.rank(method="max")
+    return np.ceil(ranks / len(values) * 5).astype("int8")
+
+
+def score(customers):
+    # Recency is measured from the latest order in the data, not from today
+    as_of = customers["Last Order"].max()
+    scored = customers.assign(
+        **{"Recency (days)": (as_of - customers["Last Order"]).dt.days}
+    )
+    if scored.empty:
+        return scored.assign(R=0, F=0, M=0, RFM="", Bucket=OTHER_BUCKET)
+    r = _quintile(-scored["Recency (days)"])
+    f = _quintile(scored["Orders"])
+    m = _quintile(scored["Total Sales"])
+    scored["R"], scored["F"], scored["M"] = r, f, m
+    scored["RFM"] = r.astype(str) + f.astype(str) + m.astype(str)
+    scored["Bucket"] = pd.Categorical(
+        np.select(
+            [condition(r, f) for _, condition in RFM_BUCKETS],
+            [name for name, _ in RFM_BUCKETS],
+            default=OTHER_BUCKET,
+        ),
+        categories=[name for name, _ in RFM_BUCKETS] + [OTHER_BUCKET],
+    )
+    return scored
+
+
+def build_store(file_path):
+    # Partitions are folded in one at a time, so only one partition and the
+    # customer tables are in memory at once
+    if not engine.is_partitioned(file_path):
+        df = engine.load_data(file_path)
+        return aggregate_orders(df), order_months(df)
+    customers, months = None, None
+    for month in engine.partitions_for(file_path):
+        df = engine.load_partition(file_path, month)
+        if customers is None:
+            customers, months = aggregate_orders(df), order_months(df)
+        else:
+            customers = merge_aggregates([customers, aggregate_orders(df)])
+            months = merge_months([months, order_months(df)])
+    return customers, months
+
+
+def _read_store(out_dir):
+    paths = [os.path.join(out_dir, name) for name in (STORE_FILE, ACTIVITY_FILE)]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return tuple(pd.read_parquet(path) for path in paths)
+
+
+def _write_store(out_dir, customers, months):
+    # Write then rename so readers never see a half-written store
+    for name, df in [(STORE_FILE, customers), (ACTIVITY_FILE, months)]:
+        path = os.path.join(out_dir, name)
+        df.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+
+
+def update_store(out_dir, new_orders, manifest):
+    # Call after write_partitions(new_orders, out_dir, merge=True). When every
+    # new order really was new, it is folded into the stored tables. If some
+    # replaced an earlier copy, the partitions hold fewer rows than the store
+    # plus the new orders, and the store is rebuilt since first/last order
+    # dates can't be subtracted.
+    stored = _read_store(out_dir)
+    total_rows = sum(p["rows"] for p in manifest["partitions"].values())
+    if stored is not None and stored[0]["Orders"].sum() + len(new_orders) == total_rows:
+        customers = merge_aggregates([stored[0], aggregate_orders(new_orders)])
+        months = merge_months([stored[1], order_months(new_orders)])
+        mode = "updated"
+    else:
+        customers, months = build_store(out_dir)
+        mode = "rebuilt"
+    _write_store(out_dir, customers, months)
+    return mode, len(customers)
+
+
+def _customer_orders(out_dir, manifest, names):
+    # Every stored order of the given customers, reading only the columns
+    # aggregate_orders() needs
+    columns = ["Customer Name", "Date", "Total Sales", "Margin"] + LATEST_COLUMNS
+    frames = [
+        pd.read_parquet(
+            engine.partition_path(out_dir, month),
+            columns=columns,
+            filters=[("Customer Name", "in", list(names))],
+        )
+        for month in sorted(manifest["partitions"])
+    ]
+    return engine.concat_frames(frames) if frames else pd.DataFrame(columns=columns)
+
+
+def apply_changes(out_dir, manifest, removed, added, written):
+    # Call after deltas.py has rewritten the partitions holding changed orders.
+    # removed holds the old copies of updated and deleted orders, added the new
+    # rows, and written the rewritten months' rows by month. Order counts and
+    # totals are adjusted by subtracting the old rows and adding the new ones.
+    # Customers who lost their first or latest order are recomputed from their
+    # orders, since dates can't be subtracted.
+    stored = _read_store(out_dir)
+    if stored is None:
+        customers, months = build_store(out_dir)
+        _write_store(out_dir, customers, months)
+        return "rebuilt", len(customers)
+    customers, months = stored
+
+    # Keyed by plain names, as the two tables have different categories
+    table = customers.astype({"Customer Name": str}).set_index("Customer Name")
+    recompute = []
+    if not removed.empty:
+        gone = aggregate_orders(removed).astype({"Customer Name": str})
+        gone = gone.set_index("Customer Name")
+        current = table.reindex(gone.index)
+        at_edge = (gone["First Order"] <= current["First Order"]) | (
+            gone["Last Order"] >= current["Last Order"]
+        )
+        recompute = list(gone.index[at_edge.to_numpy()])
+        adjusted = gone.index[~at_edge.to_numpy()]
+        summed = ["Orders", "Total Sales", "Margin"]
+        table.loc[adjusted, summed] -= gone.loc[adjusted, summed]
+
+    frames = [table.drop(recompute).reset_index().astype({"Customer Name": "category"})]
+    new_orders = added[~added["Customer Name"].isin(recompute)]
+    if not new_orders.empty:
+        frames.append(aggregate_orders(new_orders))
+    if recompute:
+        orders = _customer_orders(out_dir, manifest, recompute)
+        if not orders.empty:
+            frames.append(aggregate_orders(orders))
+    customers = merge_aggregates(frames)
+
+    # The rewritten months' activity is taken afresh from their rows
+    touched = pd.PeriodIndex(list(written), freq="M").to_timestamp()
+    months = merge_months(
+        [months[~months["Month"].isin(touched)]]
+        + [order_months(df) for df in written.values() if not df.empty]
+    )
+    _write_store(out_dir, customers, months)
+    return "adjusted", len(customers)
+
+
+@engine.memoized(maxsize=4)
+def _load_store(file_path):
+    if engine.is_partitioned(file_path):
+        stored = _read_store(file_path)
+        # A store left behind by an older ingest is ignored
+        if stored is not None and stored[0]["Orders"].sum() == engine.dataset_rows(
+            file_path
+        ):
+            return stored
+    return build_store(file_path)
+
+
+@engine.memoized(maxsize=4)
+def customer_table(file_path=engine.DATA_FILE):
+    return score(_load_store(file_path)[0])
+
+
+@engine.memoized(maxsize=256)
+def filter_customers(filters, buckets=None, file_path=engine.DATA_FILE):
+    # The date range applies to the first order date, and segments and states
+    # to the customer's latest order. Categories are not tracked per customer.
+    customers = customer_table(file_path)
+    mask = np.ones(len(customers), dtype=bool)
+    if filters.start_date is not None:
+        mask &= (customers["First Order"] >= filters.start_date).to_numpy()
+    if filters.end_date is not None:
+        mask &= (customers["First Order"] <= filters.end_date).to_numpy()
+    for column, values in [
+        ("Customer Segment", filters.segments),
+        ("State", filters.states),
+        ("Bucket", buckets),
+    ]:
+        if values is not None:
+            mask &= customers[column].isin(values).to_numpy()
+    return customers[mask]
+
+
+@engine.memoized(maxsize=256)
+def cohort_retention(filters, buckets=None, file_path=engine.DATA_FILE):
+    # Share of each monthly acquisition cohort ordering again N months after
+    # their first order
+    customers = filter_customers(filters, buckets, file_path)
+    months = _load_store(file_path)[1]
+    cohorts = customers.set_index("Customer Name")["First Order"].dt.to_period("M")
+    months = months[months["Customer Name"].isin(cohorts.index)]
+
+    cohort = months["Customer Name"].map(cohorts).astype("period[M]")
+    age = months["Month"].dt.to_period("M").astype("int64") - cohort.astype("int64")
+    counts = (
+        pd.DataFrame({"Cohort": cohort.dt.to_timestamp(), "Months Since First": age})
+        .groupby(["Cohort", "Months Since First"])
+        .size()
+        .rename("Customers")
+        .reset_index()
+    )
+    sizes = counts[counts["Months Since First"] == 0].set_index("Cohort")["Customers"]
+    counts["Retention %"] = counts["Customers"] / counts["Cohort"].map(sizes) * 100
+    return counts
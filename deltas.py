@@ -0,0 +1,206 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import customers
+import engine
+
+# Corrections re-sent by upstream systems, applied to a partition directory
+# written by ingest.py without rewriting the months they don't touch. A delta
+# file is a sales CSV with an extra Op column: "insert" and "update" rows carry
+# the whole order and replace any stored copy with the same Order ID, and
+# "delete" rows need only the Order ID. Within a file the last row for an order
+# wins.
+# The months holding the stored copies are found through the order index, a
+# hashed Order ID -> month lookup kept next to the partitions. The daily cubes
+# of the rewritten months and the customer store are adjusted by subtracting
+# the old rows and adding the new ones.
+OP_COLUMN = "Op"
+UPSERTS = ["insert", "update"]
+DELETE = "delete"
+
+
+def _order_ids(values):
+    # ORD-1001 -> 1001, as compact() does on load
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype("int64")
+    return pd.to_numeric(
+        values.astype(str).str.removeprefix(engine.ORDER_ID_PREFIX)
+    ).astype("int64")
+
+
+def read_deltas(file_path):
+    # The inserted and updated rows in partition form, and the order IDs to
+    # delete
+    df = pd.read_csv(file_path)
+    if OP_COLUMN not in df.columns:
+        raise ValueError(f"{file_path} has no {OP_COLUMN} column")
+    ops = df[OP_COLUMN].str.strip().str.lower()
+    unknown = set(ops.fillna("(blank)")) - set(UPSERTS + [DELETE])
+    if unknown:
+        raise ValueError(f"Unknown {OP_COLUMN} values: {', '.join(sorted(unknown))}")
+    df = df.assign(**{OP_COLUMN: ops, "Order ID": _order_ids(df["Order ID"])})
+    df = df.drop_duplicates("Order ID", keep="last")
+
+    deletes = df.loc[df[OP_COLUMN] == DELETE, "Order ID"].to_numpy()
+    upserts = df[df[OP_COLUMN] != DELETE].drop(columns=OP_COLUMN)
+    incomplete = upserts.columns[upserts.isna().any()].tolist()
+    if incomplete:
+        raise ValueError(f"Inserted or updated rows missing {', '.join(incomplete)}")
+    if upserts.empty:
+        # A file of deletes only; apply_deltas() gives it the partition schema
+        return upserts, deletes
+    # Empty cells in delete rows leave Units Sold parsed as float
+    upserts = upserts.astype({"Units Sold": "int64"}).reset_index(drop=True)
+    return engine.compact(engine.parse_sales(upserts)), deletes
+
+
+def _index_path(out_dir):
+    return os.path.join(out_dir, engine.ORDER_INDEX_FILE)
+
+
+def build_order_index(out_dir, manifest):
+    # Order ID -> month of every stored order, from the Order ID columns alone
+    frames = [
+        pd.DataFrame(
+            {
+                "Order ID": pd.read_parquet(
+                    engine.partition_path(out_dir, month), columns=["Order ID"]
+                )["Order ID"],
+                "Month": month,
+            }
+        )
+        for month in sorted(manifest["partitions"])
+    ]
+    if not frames:
+        return pd.Series(
+            [], index=pd.Index([], dtype="int64", name="Order ID"), name="Month"
+        )
+    return pd.concat(frames, ignore_index=True).set_index("Order ID")["Month"]
+
+
+def load_order_index(out_dir, manifest):
+    # The stored index, rebuilt when missing or out of step with the manifest
+    path = _index_path(out_dir)
+    if os.path.exists(path):
+        index = pd.read_parquet(path).set_index("Order ID")["Month"]
+        if len(index) == sum(p["rows"] for p in manifest["partitions"].values()):
+            return index
+    return build_order_index(out_dir, manifest)
+
+
+def save_order_index(out_dir, index):
+    path = _index_path(out_dir)
+    index.astype("category").reset_index().to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def adjust_cube(cube, removed, added):
+    # Subtract the removed rows' daily totals and add the added rows'. Cells
+    # left without orders are dropped.
+    removed_cube = engine.build_cube(removed)
+    measures = [column for column in removed_cube if column not in engine.CUBE_KEYS]
+    removed_cube[measures] = -removed_cube[measures]
+    merged = (
+        engine.concat_frames([cube, removed_cube, engine.build_cube(added)])
+        .groupby(engine.CUBE_KEYS, observed=True)[measures]
+        .sum()
+        .reset_index()
+    )
+    return merged[merged["Orders"] > 0].reset_index(drop=True)
+
+
+def apply_deltas(out_dir, upserts, deletes):
+    started = time.perf_counter()
+    if not engine.is_partitioned(out_dir):
+        raise ValueError(f"{out_dir} is not a partition directory; run ingest.py first")
+    manifest = engine.load_manifest(out_dir)
+    index = load_order_index(out_dir, manifest)
+
+    if manifest["partitions"]:
+        sample = engine.partition_path(out_dir, min(manifest["partitions"]))
+        if upserts.empty:
+            upserts = pd.read_parquet(sample).iloc[:0]
+        missing = set(pq.read_schema(sample).names) - set(upserts.columns)
+        if missing:
+            raise ValueError(f"Inserted or updated rows missing {', '.join(missing)}")
+
+    changed = np.union1d(upserts["Order ID"].to_numpy(), deletes)
+    positions = index.index.get_indexer(changed)
+    stored = index.iloc[positions[positions >= 0]]
+
+    new_months = upserts["Date"].dt.to_period("M").astype(str)
+    new_by_month = dict(tuple(upserts.groupby(new_months)))
+    removed, written = [], {}
+    for month in sorted(set(stored) | set(new_months)):
+        added = new_by_month.get(month, upserts.iloc[:0])
+        if month in manifest["partitions"]:
+            existing = pd.read_parquet(engine.partition_path(out_dir, month))
+            cube_path = engine.cube_path(out_dir, month)
+            if os.path.exists(cube_path):
+                cube = pd.read_parquet(cube_path)
+            else:
+                cube = engine.build_cube(existing)
+        else:
+            existing, cube = added.iloc[:0], engine.build_cube(added.iloc[:0])
+        old = existing["Order ID"].isin(changed).to_numpy()
+        # Empty frames would still take part in picking the column dtypes
+        frames = [df for df in [existing[~old], added.copy()] if not df.empty]
+        month_df = engine.concat_frames(frames) if frames else existing.iloc[:0]
+        cube = adjust_cube(cube, existing[old], added)
+        engine.write_partition(out_dir, manifest, month, month_df, cube)
+        if old.any():
+            removed.append(existing[old])
+        written[month] = month_df
+
+    removed = engine.concat_frames(removed) if removed else upserts.iloc[:0]
+    customer_mode, customer_count = customers.apply_changes(
+        out_dir, manifest, removed, upserts, written
+    )
+    index = pd.concat(
+        [
+            index[~index.index.isin(changed)],
+            pd.Series(new_months.to_numpy(), index=upserts["Order ID"], name="Month"),
+        ]
+    )
+    save_order_index(out_dir, index)
+    engine.save_manifest(out_dir, manifest, upserts)
+
+    known = upserts["Order ID"].isin(stored.index)
+    return {
+        "inserted": int((~known).sum()),
+        "updated": int(known.sum()),
+        "deleted": int(np.isin(deletes, stored.index).sum()),
+        "missing": int((~np.isin(deletes, stored.index)).sum()),
+        "months": sorted(written),
+        "customers": f"{customer_mode} ({customer_count:,} customers)",
+        "seconds": time.perf_counter() - started,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Apply order inserts, updates and deletes to monthly Parquet "
+        "partitions, adjusting their pre-aggregates in place."
+    )
+    parser.add_argument(
+        "deltas",
+        help="CSV of orders with an Op column: insert, update or delete.",
+    )
+    parser.add_argument("--partition-dir", default="sales_partitions")
+    args = parser.parse_args()
+
+    upserts, deletes = read_deltas(args.deltas)
+    report = apply_deltas(args.partition_dir, upserts, deletes)
+    print(
+        f"Applied {args.deltas}: {report['inserted']:,} inserted, "
+        f"{report['updated']:,} updated, {report['deleted']:,} deleted, "
+        f"{report['missing']:,} unknown deletes skipped; "
+        f"{len(report['months'])} monthly partitions rewritten "
+        f"in {report['seconds']:.2f}s"
+    )
+    print(f"Customer store {report['customers']}")
@@ -0,0 +1,796 @@
+import glob
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from functools import lru_cache, wraps
+
+import numpy as np
+import pandas as pd
+
+import snapshot
+
+# A CSV file, a glob of CSV files (extracts/*.csv), a .txt manifest listing
+# one CSV path or glob per line, or a directory of monthly Parquet partitions
+# written by write_partitions()
+DATA_FILE = os.environ.get("DASHBOARD_DATA", "dummy_sales_data.csv")
+MANIFEST_FILE = "_manifest.json"
+# Order ID -> month lookup kept by deltas.py for partitioned data
+ORDER_INDEX_FILE = "_order_index.parquet"
+# Number of monthly partitions kept in memory, least recently used evicted first
+PARTITION_CACHE_SIZE = int(os.environ.get("DASHBOARD_PARTITION_CACHE", "24"))
+
+# Dimensions the pages filter and group by, keyed by the short names used in
+# the metrics API
+DIMENSIONS = {
+    "category": "Product Category",
+    "sub_category": "Product Sub-Category",
+    "segment": "Customer Segment",
+    "state": "State",
+}
+
+FREQUENCIES = {"Daily": "D", "Monthly": "M", "Quarterly": "Q"}
+
+# Period-over-period comparisons: the current date range shifted back by
+# this much
+COMPARISONS = {
+    "Previous month": pd.DateOffset(months=1),
+    "Previous year": pd.DateOffset(years=1),
+}
+
+# Grain of the daily pre-aggregate built by build_cube()
+CUBE_KEYS = ["Date", "State", "Product Category", "Customer Segment"]
+
+# Compact dtypes applied on load. Totals stay float64 because they are summed
+# over millions of rows; per-unit prices and percentages fit in float32.
+CATEGORY_COLUMNS = [
+    "Customer Name",
+    "Customer Segment",
+    "City",
+    "State",
+    "Product Category",
+    "Product Sub-Category",
+    "City_State",
+]
+FLOAT32_COLUMNS = ["Unit Cost", "Unit Price", "Margin %", "Latitude", "Longitude"]
+ORDER_ID_PREFIX = "ORD-"
+
+# Memory used by the most recent load of each file, before and after compaction
+_memory_reports = {}
+
+_load_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def memoized(maxsize):
+    # lru_cache keyed on the fully bound arguments, so kpis(f) and
+    # kpis(f, DATA_FILE) share one cache entry
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        cached = lru_cache(maxsize=maxsize)(fn)
+        # One lock per argument tuple being computed, with the number of
+        # callers holding or waiting for it. Concurrent first calls with the
+        # same arguments wait for one build instead of each running fn, so a
+        # cold start builds the cube once however many jobs ask for it.
+        building = {}
+        building_lock = threading.Lock()
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = bound.args
+            with building_lock:
+                lock, callers = building.get(key, (None, 0))
+                lock = lock or threading.Lock()
+                building[key] = (lock, callers + 1)
+            try:
+                with lock:
+                    return cached(*key)
+            finally:
+                with building_lock:
+                    callers = building[key][1] - 1
+                    if callers:
+                        building[key] = (lock, callers)
+                    else:
+                        del building[key]
+
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+
+    return decorator
+
+
+@dataclass(frozen=True)
+class Filters:
+    # None means "no filter" on that dimension; an empty tuple matches nothing
+    start_date: object = None
+    end_date: object = None
+    categories: tuple = None
+    segments: tuple = None
+    states: tuple = None
+
+
+def make_filters(
+    start_date=None, end_date=None, categories=None, segments=None, states=None
+):
+    # Normalize widget values into a hashable Filters so equal selections share
+    # cache entries regardless of the order they were picked in
+    def normalize(values):
+        return None if values is None else tuple(sorted(values))
+
+    return Filters(
+        start_date=pd.Timestamp(start_date) if start_date is not None else None,
+        end_date=pd.Timestamp(end_date) if end_date is not None else None,
+        categories=normalize(categories),
+        segments=normalize(segments),
+        states=normalize(states),
+    )
+
+
+def compact(df):
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    # ORD-1001 -> 1001
+    if "Order ID" in df.columns and not pd.api.types.is_integer_dtype(df["Order ID"]):
+        df["Order ID"] = pd.to_numeric(
+            df["Order ID"].str.removeprefix(ORDER_ID_PREFIX)
+        ).astype("int64")
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("float32")
+    units = df["Units Sold"]
+    if units.min() >= np.iinfo("int16").min and units.max() <= np.iinfo("int16").max:
+        df["Units Sold"] = units.astype("int16")
+    return df
+
+
+def memory_reports():
+    return dict(_memory_reports)
+
+
+def parse_sales(df):
+    # Convert Date column to datetime
+    df["Date"] = pd.to_datetime(df["Date"])
+    # Convert Margin % to a numeric value (remove '%')
+    if not pd.api.types.is_numeric_dtype(df["Margin %"]):
+        df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
+    return df
+
+
+def read_sales(file_path):
+    df = parse_sales(pd.read_csv(file_path))
+
+    before = int(df.memory_usage(deep=True).sum())
+    df = compact(df)
+    after = int(df.memory_usage(deep=True).sum())
+    _memory_reports[file_path] = {
+        "rows": len(df),
+        "before_bytes": before,
+        "after_bytes": after,
+    }
+    _log_load(file_path, _memory_reports[file_path])
+    return df
+
+
+def _log_load(file_path, report):
+    logger.info(
+        "Loaded %s rows from %s: %.1f MB -> %.1f MB after compaction",
+        f"{report['rows']:,}",
+        file_path,
+        report["before_bytes"] / 1e6,
+        report["after_bytes"] / 1e6,
+    )
+
+
+def is_multi_source(file_path):
+    return glob.has_magic(file_path) or file_path.endswith(".txt")
+
+
+def source_files(file_path):
+    # Expand a glob or a .txt manifest into the list of files it names: each
+    # glob's matches in sorted path order, manifest lines in the order given.
+    # That order decides which copy of a duplicate order wins in
+    # read_sources(). Manifest entries are relative to the manifest's directory.
+    # FileNotFoundError when nothing matches.
+    if file_path.endswith(".txt"):
+        base_dir = os.path.dirname(file_path)
+        with open(file_path) as f:
+            patterns = [
+                os.path.join(base_dir, line.strip())
+                for line in f
+                if line.strip() and not line.startswith("#")
+            ]
+    else:
+        patterns = [file_path]
+    files = []
+    for pattern in patterns:
+        files.extend(
+            sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        )
+    if not files:
+        raise FileNotFoundError(f"No source files match {file_path}")
+    return files
+
+
+def concat_frames(frames):
+    # pd.concat turns categoricals with different categories into object
+    # columns, so give every frame the union of categories first. The frames'
+    # columns are replaced in place.
+    for column in CATEGORY_COLUMNS:
+        present = [df for df in frames if column in df.columns]
+        if len(present) < 2:
+            continue
+        categories = sorted(
+            set().union(*(df[column].dropna().unique() for df in present))
+        )
+        for df in present:
+            df[column] = df[column].astype(pd.CategoricalDtype(categories))
+    return pd.concat(frames, ignore_index=True)
+
+
+def deduplicate_orders(df):
+    # Later rows win, so a re-sent order replaces the earlier copy
+    return df.drop_duplicates("Order ID", keep="last").reset_index(drop=True)
+
+
+def _fill_absent_columns(df, frames):
+    # A file without a column, such as an extract without coordinates, says
+    # nothing about it: the winning copy of an order takes that column from
+    # the latest file that has it rather than leaving it blank
+    for column in df.columns:
+        present = [frame for frame in frames if column in frame.columns]
+        if len(present) == len(frames):
+            continue
+        latest = deduplicate_orders(
+            pd.concat([frame[["Order ID", column]] for frame in present])
+        ).set_index("Order ID")[column]
+        df[column] = latest.reindex(df["Order ID"]).reset_index(drop=True)
+    return df
+
+
+def _read_with_report(file_path):
+    df = read_sales(file_path)
+    return df, _memory_reports[file_path]
+
+
+@contextmanager
+def _workers_skip_main():
+    # Spawned workers re-run the parent's __main__ module before taking work.
+    # Under Streamlit that is the page script, so a blank module stands in
+    # while the workers start. Loads hold _load_lock, so only one pool starts
+    # at a time.
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def read_sources(files, max_workers=None):
+    # Parse files in parallel across cores, then merge into one frame. Files
+    # are combined in the order given (see source_files()), so for duplicate
+    # order IDs the last file wins, except in columns that file lacks.
+    if not files:
+        raise FileNotFoundError("No source files to read")
+    if len(files) == 1:
+        results = [_read_with_report(files[0])]
+    else:
+        # Workers are spawned, not forked: forking the multithreaded Streamlit
+        # server can copy locks held by other threads. One starts per submit.
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers or os.cpu_count() or 1, len(files)),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            with _workers_skip_main():
+                jobs = [executor.submit(_read_with_report, f) for f in files]
+            results = [job.result() for job in jobs]
+        # Worker logging isn't configured, so the loads are logged here
+        for file_path, (_, report) in zip(files, results):
+            _log_load(file_path, report)
+
+    frames = [df for df, _ in results]
+    before = sum(report["before_bytes"] for _, report in results)
+    df = _fill_absent_columns(deduplicate_orders(concat_frames(frames)), frames)
+    after = int(df.memory_usage(deep=True).sum())
+    logger.info(
+        "Merged %d files into %s unique orders (%s duplicates dropped)",
+        len(files),
+        f"{len(df):,}",
+        f"{sum(len(f) for f in frames) - len(df):,}",
+    )
+    return df, {"rows": len(df), "before_bytes": before, "after_bytes": after}
+
+
+def is_partitioned(file_path):
+    return os.path.isdir(file_path)
+
+
+def _partition_file(month):
+    return f"sales_{month}.parquet"
+
+
+def partition_path(out_dir, month):
+    return os.path.join(out_dir, _partition_file(month))
+
+
+def cube_path(out_dir, month):
+    # The partition's daily cube, stored next to it
+    return os.path.join(out_dir, f"cube_{month}.parquet")
+
+
+def write_partition(out_dir, manifest, month, month_df, cube=None):
+    # Write a month's rows and its daily cube (built from the rows unless
+    # given), or remove both once the month has no rows left
+    if month_df.empty:
+        for path in [partition_path(out_dir, month), cube_path(out_dir, month)]:
+            if os.path.exists(path):
+                os.remove(path)
+        manifest["partitions"].pop(month, None)
+        return
+    month_df.to_parquet(partition_path(out_dir, month), index=False)
+    if cube is None:
+        cube = build_cube(month_df)
+    cube.to_parquet(cube_path(out_dir, month), index=False)
+    manifest["partitions"][month] = {
+        "rows": len(month_df),
+        "min_date": month_df["Date"].min().strftime("%Y-%m-%d"),
+        "max_date": month_df["Date"].max().strftime("%Y-%m-%d"),
+    }
+
+
+def load_manifest(out_dir):
+    # Read fresh from disk, for writers; readers use the cached read_manifest()
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {"partitions": {}, "categories": {}}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest, df):
+    # Add df's category values, then write the manifest. Written last, after
+    # the partitions it lists.
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            values = set(manifest["categories"].get(column, []))
+            values.update(df[column].dropna().unique())
+            manifest["categories"][column] = sorted(values)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def write_partitions(df, out_dir, merge=False):
+    # Write one Parquet file per month plus a manifest of date ranges, row
+    # counts and category values so readers can prune without opening files.
+    # Months already in out_dir are replaced, or with merge=True combined with
+    # the new rows (deduplicated by order ID); other months are kept.
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    months = df["Date"].dt.to_period("M").astype(str)
+    new_by_month = dict(tuple(df.groupby(months)))
+    if merge:
+        # Drop every existing copy of a re-sent order, including copies in
+        # months the new rows don't touch (the order's date may have changed).
+        # Only the Order ID column is read unless a partition needs rewriting.
+        for month in list(manifest["partitions"]):
+            path = partition_path(out_dir, month)
+            ids = pd.read_parquet(path, columns=["Order ID"])["Order ID"]
+            if month not in new_by_month and not ids.isin(df["Order ID"]).any():
+                continue
+            existing = pd.read_parquet(path)
+            existing = existing[~existing["Order ID"].isin(df["Order ID"])]
+            if month in new_by_month:
+                new_by_month[month] = concat_frames(
+                    [existing, new_by_month[month].copy()]
+                )
+            else:
+                write_partition(out_dir, manifest, month, existing)
+
+    for month, month_df in new_by_month.items():
+        write_partition(out_dir, manifest, month, month_df)
+    # The order index no longer matches; deltas.py rebuilds it when next used
+    index_path = os.path.join(out_dir, ORDER_INDEX_FILE)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    save_manifest(out_dir, manifest, df)
+    return manifest
+
+
+@memoized(maxsize=4)
+def read_manifest(file_path):
+    with open(os.path.join(file_path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def source_paths(file_path, month=None):
+    # The files a load depends on; a snapshot is reused only while none of
+    # them has changed
+    if is_partitioned(file_path):
+        paths = [os.path.join(file_path, MANIFEST_FILE)]
+        if month is not None:
+            paths.append(partition_path(file_path, month))
+        return paths
+    return source_files(file_path)
+
+
+def _with_manifest_categories(df, file_path):
+    # Give every partition the same categories so they concatenate without
+    # falling back to object columns
+    for column, values in read_manifest(file_path)["categories"].items():
+        if column in df.columns:
+            df[column] = df[column].astype(pd.CategoricalDtype(values))
+    return df
+
+
+def _read_partition(file_path, month):
+    return _with_manifest_categories(
+        pd.read_parquet(partition_path(file_path, month)), file_path
+    )
+
+
+@memoized(maxsize=PARTITION_CACHE_SIZE)
+def load_partition(file_path, month):
+    return snapshot.shared_frame(
+        snapshot.snapshot_name(f"partition-{month}", file_path),
+        snapshot.fingerprint(source_paths(file_path, month)),
+        lambda: _read_partition(file_path, month),
+    )
+
+
+def partitions_for(file_path, start_date=None, end_date=None):
+    # Months whose date range overlaps [start_date, end_date]
+    months = []
+    for month, info in sorted(read_manifest(file_path)["partitions"].items()):
+        if end_date is not None and pd.Timestamp(info["min_date"]) > end_date:
+            continue
+        if start_date is not None and pd.Timestamp(info["max_date"]) < start_date:
+            continue
+        months.append(month)
+    return tuple(months)
+
+
+def _concat_partitions(frames, file_path):
+    # Partitions share the manifest's categories, so they concatenate as
+    # categoricals. The result is a new frame and isn't cached.
+    if not frames:
+        return load_partition(file_path, partitions_for(file_path)[0]).iloc[:0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _parse_data(file_path):
+    if is_multi_source(file_path):
+        df, report = read_sources(source_files(file_path))
+        _memory_reports[file_path] = report
+        return df
+    return read_sales(file_path)
+
+
+@memoized(maxsize=4)
+def _load_data(file_path):
+    return snapshot.shared_frame(
+        snapshot.snapshot_name("sales", file_path),
+        snapshot.fingerprint(source_paths(file_path)),
+        lambda: _parse_data(file_path),
+    )
+
+
+def load_data(file_path=DATA_FILE):
+    # One parsed copy per process, shared by every page, session and API call.
+    # Callers must treat the returned frame as read-only. The lock keeps a
+    # page and the cache warmer from parsing the same file twice.
+    # Partitioned data has no single frame: this concatenates every partition
+    # into a new, uncached copy. Prefer filter_data() or load_partition().
+    with _load_lock:
+        if is_partitioned(file_path):
+            frames = [load_partition(file_path, m) for m in partitions_for(file_path)]
+            return _concat_partitions(frames, file_path)
+        return _load_data(file_path)
+
+
+@memoized(maxsize=4)
+def dataset_rows(file_path=DATA_FILE):
+    if is_partitioned(file_path):
+        return sum(p["rows"] for p in read_manifest(file_path)["partitions"].values())
+    return len(load_data(file_path))
+
+
+@memoized(maxsize=16)
+def dimension_values(column, file_path=DATA_FILE):
+    if is_partitioned(file_path):
+        return tuple(read_manifest(file_path)["categories"][column])
+    return tuple(sorted(load_data(file_path)[column].unique()))
+
+
+@memoized(maxsize=4)
+def date_bounds(file_path=DATA_FILE):
+    if is_partitioned(file_path):
+        partitions = read_manifest(file_path)["partitions"].values()
+        return (
+            pd.Timestamp(min(p["min_date"] for p in partitions)).date(),
+            pd.Timestamp(max(p["max_date"] for p in partitions)).date(),
+        )
+    dates = load_data(file_path)["Date"]
+    return dates.min().to_pydatetime().date(), dates.max().to_pydatetime().date()
+
+
+def filter_mask(df, filters):
+    mask = pd.Series(True, index=df.index)
+    if filters.start_date is not None:
+        mask &= df["Date"] >= filters.start_date
+    if filters.end_date is not None:
+        mask &= df["Date"] <= filters.end_date
+    for column, values in [
+        ("Product Category", filters.categories),
+        ("Customer Segment", filters.segments),
+        ("State", filters.states),
+    ]:
+        if values is not None:
+            mask &= df[column].isin(values)
+    return mask.to_numpy()
+
+
+@memoized(maxsize=256)
+def filtered_index(filters, file_path=DATA_FILE):
+    # Row positions in load_data() matching the filters, for unpartitioned
+    # data; aggregates below share this result
+    return filter_mask(load_data(file_path), filters).nonzero()[0]
+
+
+@memoized(maxsize=1024)
+def partition_index(filters, month, file_path=DATA_FILE):
+    # Row positions in load_partition() matching the filters
+    with _load_lock:
+        df = load_partition(file_path, month)
+    return filter_mask(df, filters).nonzero()[0]
+
+
+def filter_data(filters, file_path=DATA_FILE):
+    # Partitioned data is filtered one cached partition at a time, so only the
+    # matching rows are copied, never the whole date window
+    if not is_partitioned(file_path):
+        return load_data(file_path).iloc[filtered_index(filters, file_path)]
+    months = partitions_for(file_path, filters.start_date, filters.end_date)
+    return _concat_partitions(
+        [
+            load_partition(file_path, month).iloc[
+                partition_index(filters, month, file_path)
+            ]
+            for month in months
+        ],
+        file_path,
+    )
+
+
+def compute_kpis(df):
+    if df.empty:
+        return {"total_sales": 0.0, "total_margin": 0.0, "avg_margin_pct": 0.0}
+    return {
+        "total_sales": float(df["Total Sales"].sum()),
+        "total_margin": float(df["Margin"].sum()),
+        "avg_margin_pct": float(df["Margin %"].mean()),
+    }
+
+
+def sum_sales_by(df, by):
+    # observed=True keeps unused categories out of the result
+    return df.groupby(by, as_index=False, observed=True)["Total Sales"].sum()
+
+
+def sum_sales_by_period(df, column, freq="D"):
+    period_df = df[[column, "Date", "Total Sales"]].copy()
+    if freq == "D":
+        period_df["Period"] = period_df["Date"]
+    else:
+        period_df["Period"] = period_df["Date"].dt.to_period(freq).dt.to_timestamp()
+    return (
+        period_df.groupby([column, "Period"], as_index=False, observed=True)[
+            "Total Sales"
+        ]
+        .sum()
+        .sort_values("Period")
+    )
+
+
+def build_cube(df):
+    # Daily totals per State x Product Category x Customer Segment. Every page
+    # filter is on one of these columns, so the cube can stand in for the raw
+    # rows wherever only totals are needed.
+    return (
+        df.assign(**{"Margin %": df["Margin %"].astype("float64")})
+        .groupby(CUBE_KEYS, observed=True)
+        .agg(
+            **{
+                "Total Sales": ("Total Sales", "sum"),
+                "Margin": ("Margin", "sum"),
+                "Margin % Sum": ("Margin %", "sum"),
+                "Orders": ("Margin %", "size"),
+            }
+        )
+        .reset_index()
+    )
+
+
+# Cached accessors. Results are shared between callers and must not be
+# mutated; copy or use .assign() before adding columns.
+
+
+def _partition_cube(file_path, month):
+    # The cube stored with the partition; partitions written before cubes were
+    # stored are aggregated from their rows
+    path = cube_path(file_path, month)
+    if not os.path.exists(path):
+        return build_cube(load_partition(file_path, month))
+    return _with_manifest_categories(pd.read_parquet(path), file_path)
+
+
+def _build_daily_cube(file_path):
+    if is_partitioned(file_path):
+        # A day never spans two partitions, so the partition cubes concatenate
+        return concat_frames(
+            [_partition_cube(file_path, month) for month in partitions_for(file_path)]
+        )
+    return build_cube(load_data(file_path))
+
+
+@memoized(maxsize=4)
+def daily_cube(file_path=DATA_FILE):
+    return snapshot.shared_frame(
+        snapshot.snapshot_name("cube", file_path),
+        snapshot.fingerprint(source_paths(file_path)),
+        lambda: _build_daily_cube(file_path),
+    )
+
+
+def _planned(group_by, filters, freq, file_path):
+    # The planner picks the cheapest source for each aggregate: prefix sums or
+    # the daily cube where they can answer it, the raw rows otherwise. It
+    # builds on this module, so it is imported on first use.
+    import planner
+
+    return planner.execute(planner.Query(group_by, filters, freq), file_path)
+
+
+@memoized(maxsize=1024)
+def kpis(filters, file_path=DATA_FILE):
+    return _planned((), filters, "D", file_path)
+
+
+@memoized(maxsize=1024)
+def sales_over_time(filters, file_path=DATA_FILE):
+    return _planned(("Date",), filters, "D", file_path)
+
+
+@memoized(maxsize=1024)
+def sales_by(column, filters, file_path=DATA_FILE):
+    return _planned((column,), filters, "D", file_path)
+
+
+@memoized(maxsize=1024)
+def sales_by_period(column, filters, freq="D", file_path=DATA_FILE):
+    return _planned((column, "Period"), filters, freq, file_path)
+
+
+def shift_filters(filters, offset):
+    return replace(
+        filters,
+        start_date=None if filters.start_date is None else filters.start_date - offset,
+        end_date=None if filters.end_date is None else filters.end_date - offset,
+    )
+
+
+def cube_rows(filters, file_path=DATA_FILE):
+    cube = daily_cube(file_path)
+    return cube[filter_mask(cube, filters)]
+
+
+@memoized(maxsize=256)
+def row_count(filters, file_path=DATA_FILE):
+    # Rows matching the filters, counted from the cube's Orders column: every
+    # filter is on a cube key, so no rows are read
+    return int(cube_rows(filters, file_path)["Orders"].sum())
+
+
+# Comparison windows are answered from the daily cube, so a period-over-period
+# view never scans the rows a second time
+
+
+@memoized(maxsize=1024)
+def previous_kpis(filters, comparison, file_path=DATA_FILE):
+    # None when the comparison window has no sales
+    rows = cube_rows(shift_filters(filters, COMPARISONS[comparison]), file_path)
+    orders = rows["Orders"].sum()
+    if not orders:
+        return None
+    return {
+        "total_sales": float(rows["Total Sales"].sum()),
+        "total_margin": float(rows["Margin"].sum()),
+        "avg_margin_pct": float(rows["Margin % Sum"].sum() / orders),
+    }
+
+
+@memoized(maxsize=1024)
+def previous_sales_by_period(
+    column, filters, comparison, freq="D", file_path=DATA_FILE
+):
+    # The comparison window's sales moved forward onto the current window's
+    # dates before bucketing, so both line up on one axis
+    offset = COMPARISONS[comparison]
+    rows = cube_rows(shift_filters(filters, offset), file_path)
+    return sum_sales_by_period(rows.assign(Date=rows["Date"] + offset), column, freq)
+
+
+def kpi_changes(current, previous):
+    # Percent change in the totals and point change in the average margin.
+    # None when there is nothing to compare against.
+    if previous is None:
+        return None
+
+    def percent(key):
+        if not previous[key]:
+            return None
+        return (current[key] / previous[key] - 1) * 100
+
+    return {
+        "total_sales": percent("total_sales"),
+        "total_margin": percent("total_margin"),
+        "avg_margin_pct": current["avg_margin_pct"] - previous["avg_margin_pct"],
+    }
+
+
+@memoized(maxsize=16)
+def top_orders(column, n=5, file_path=DATA_FILE):
+    # The n largest orders over all history. Partitioned data is scanned one
+    # partition at a time so the whole history is never held at once.
+    if not is_partitioned(file_path):
+        return load_data(file_path).nlargest(n, column)
+    candidates = [
+        load_partition(file_path, month).nlargest(n, column)
+        for month in partitions_for(file_path)
+    ]
+    return pd.concat(candidates, ignore_index=True).nlargest(n, column)
+
+
+def top_n(column, filters, n=5, file_path=DATA_FILE):
+    return (
+        sales_by(column, filters, file_path)
+        .sort_values("Total Sales", ascending=False)
+        .head(n)
+    )
+
+
+def clear_caches():
+    for cached in [
+        read_manifest,
+        load_partition,
+        _load_data,
+        dataset_rows,
+        top_orders,
+        dimension_values,
+        date_bounds,
+        filtered_index,
+        partition_index,
+        daily_cube,
+        row_count,
+        previous_kpis,
+        previous_sales_by_period,
+        kpis,
+        sales_over_time,
+        sales_by,
+        sales_by_period,
+    ]:
+        cached.cache_clear()
@@ -0,0 +1,231 @@
+import io
+import os
+import shutil
+import tempfile
+from urllib.parse import urlencode
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import engine
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# Exports are written CHUNK_ROWS rows at a time, so memory stays bounded by one
+# chunk however large the slice is
+CHUNK_ROWS = 100_000
+# Slices up to this size can be downloaded straight from the page. Streamlit
+# holds download payloads in memory, so larger slices go through the metrics
+# API's streaming /export endpoint instead.
+DOWNLOAD_MAX_ROWS = int(os.environ.get("DASHBOARD_DOWNLOAD_MAX_ROWS", "250000"))
+# Parquet is suggested above this size
+LARGE_SLICE_ROWS = 100_000
+# Excel's sheet limit, less the header row
+EXCEL_MAX_ROWS = 1_048_575
+
+FORMATS = {
+    "csv": ("CSV", "text/csv", "csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet", "parquet"),
+}
+if xlsxwriter is not None:
+    FORMATS["xlsx"] = (
+        "Excel",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "xlsx",
+    )
+
+
+class ExportError(ValueError):
+    pass
+
+
+def iter_chunks(filters, file_path=engine.DATA_FILE, chunk_rows=CHUNK_ROWS):
+    # The filtered rows in order, as frames of at most chunk_rows rows.
+    # Partitioned data is filtered one partition at a time rather than through
+    # the concatenated window.
+    if engine.is_partitioned(file_path):
+        for month in engine.partitions_for(
+            file_path, filters.start_date, filters.end_date
+        ):
+            df = engine.load_partition(file_path, month)
+            positions = engine.partition_index(filters, month, file_path)
+            for start in range(0, len(positions), chunk_rows):
+                yield df.iloc[positions[start : start + chunk_rows]]
+        return
+
+    df = engine.load_data(file_path)
+    positions = engine.filtered_index(filters, file_path)
+    for start in range(0, len(positions), chunk_rows):
+        yield df.iloc[positions[start : start + chunk_rows]]
+
+
+def _empty_frame(file_path):
+    if engine.is_partitioned(file_path):
+        return engine.load_partition(file_path, engine.partitions_for(file_path)[0])[:0]
+    return engine.load_data(file_path).iloc[:0]
+
+
+def write_csv(filters, out, file_path=engine.DATA_FILE):
+    # out is a binary file; each chunk is encoded straight into it
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    try:
+        header = True
+        for chunk in iter_chunks(filters, file_path):
+            chunk.to_csv(text, header=header, index=False, date_format="%Y-%m-%d")
+            header = False
+        if header:
+            _empty_frame(file_path).to_csv(text, index=False)
+    finally:
+        # Leave out open for the caller, even if the client went away
+        text.detach()
+
+
+def write_parquet(filters, out, file_path=engine.DATA_FILE):
+    # One row group per chunk; the schema comes from the stored frame so an
+    # empty slice still produces a readable file
+    schema = pa.Schema.from_pandas(_empty_frame(file_path), preserve_index=False)
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in iter_chunks(filters, file_path):
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
+
+
+def write_xlsx(filters, out, file_path=engine.DATA_FILE):
+    columns = list(_empty_frame(file_path).columns)
+
+    # constant_memory flushes each row to disk as it's written. The finished
+    # workbook is a zip, so it's assembled in a temporary file and then copied.
+    with tempfile.TemporaryFile() as workbook_file:
+        workbook = xlsxwriter.Workbook(
+            workbook_file, {"constant_memory": True, "nan_inf_to_errors": True}
+        )
+        sheet = workbook.add_worksheet("Sales")
+        sheet.set_column(
+            columns.index("Date"),
+            columns.index("Date"),
+            12,
+            workbook.add_format({"num_format": "yyyy-mm-dd"}),
+        )
+        sheet.write_row(0, 0, columns)
+        row = 1
+        for chunk in iter_chunks(filters, file_path):
+            for values in zip(*(chunk[column].tolist() for column in columns)):
+                sheet.write_row(row, 0, values)
+                row += 1
+        workbook.close()
+        workbook_file.seek(0)
+        shutil.copyfileobj(workbook_file, out)
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet, "xlsx": write_xlsx}
+
+
+def check_export(fmt, filters, file_path=engine.DATA_FILE):
+    # Raise before anything is written, so a streamed response can still
+    # report the error
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown export format: {fmt}")
+    rows = engine.row_count(filters, file_path)
+    if fmt == "xlsx" and rows > EXCEL_MAX_ROWS:
+        raise ExportError(
+            f"Excel sheets hold at most {EXCEL_MAX_ROWS:,} rows; use CSV or Parquet"
+        )
+
+
+def write_export(fmt, filters, out, file_path=engine.DATA_FILE):
+    check_export(fmt, filters, file_path)
+    WRITERS[fmt](filters, out, file_path)
+
+
+def export_file_name(page, fmt):
+    return f"{page}_sales.{FORMATS[fmt][2]}"
+
+
+def export_query(filters, fmt):
+    # The metrics API query string that reproduces these filters
+    params = [("format", fmt)]
+    if filters.start_date is not None:
+        params.append(("start", filters.start_date.strftime("%Y-%m-%d")))
+    if filters.end_date is not None:
+        params.append(("end", filters.end_date.strftime("%Y-%m-%d")))
+    for param, values in [
+        ("category", filters.categories),
+        ("segment", filters.segments),
+        ("state", filters.states),
+    ]:
+        if values is not None:
+            params += [(param, value) for value in values]
+    return urlencode(params)
+
+
+def export_base_url():
+    # Set DASHBOARD_EXPORT_URL to the metrics API's address as the browser sees
+    # it; otherwise the API is assumed to run on this host
+    if os.environ.get("DASHBOARD_EXPORT_URL"):
+        return os.environ["DASHBOARD_EXPORT_URL"].rstrip("/")
+    if os.environ.get("DASHBOARD_API_PORT"):
+        return f"http://localhost:{os.environ['DASHBOARD_API_PORT']}"
+    return None
+
+
+def _build_download(fmt, filters, file_path):
+    # Runs when the download button is clicked, not on every rerun. Streamlit
+    # keeps the payload as bytes, so the file is read back and closed.
+    def build():
+        with tempfile.TemporaryFile() as out:
+            write_export(fmt, filters, out, file_path)
+            out.seek(0)
+            return out.read()
+
+    return build
+
+
+def render_export_panel(filters, page, file_path=engine.DATA_FILE):
+    # Call near the bottom of a page script with the filters behind its charts
+    import streamlit as st
+
+    with st.sidebar.expander("⬇️ Export filtered rows"):
+        rows = engine.row_count(filters, file_path)
+        st.caption(f"{rows:,} rows match the current filters.")
+        if not rows:
+            return
+
+        choices = list(FORMATS)
+        fmt = st.radio(
+            "Format",
+            choices,
+            index=choices.index("parquet") if rows > LARGE_SLICE_ROWS else 0,
+            format_func=lambda choice: FORMATS[choice][0],
+            horizontal=True,
+            key=f"export_format_{page}",
+        )
+        if rows > LARGE_SLICE_ROWS and fmt != "parquet":
+            st.caption("Parquet is much smaller and faster for slices this large.")
+        if fmt == "xlsx" and rows > EXCEL_MAX_ROWS:
+            st.warning(f"Excel sheets hold at most {EXCEL_MAX_ROWS:,} rows.")
+            return
+
+        base_url = export_base_url()
+        if base_url is not None:
+            # Streamed by the metrics API, chunk by chunk
+            st.link_button(
+                "Download",
+                f"{base_url}/export?{export_query(filters, fmt)}",
+            )
+        elif rows <= DOWNLOAD_MAX_ROWS:
+            st.download_button(
+                "Download",
+                _build_download(fmt, filters, file_path),
+                file_name=export_file_name(page, fmt),
+                mime=FORMATS[fmt][1],
+            )
+        else:
+            st.caption(
+                f"Slices over {DOWNLOAD_MAX_ROWS:,} rows are streamed by the "
+                "metrics API. Start the dashboard with DASHBOARD_API_PORT set "
+                "to enable the download."
+            )
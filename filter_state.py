@@ -0,0 +1,172 @@
+import os
+from datetime import date
+
+import streamlit as st
+
+import engine
+
+# Sidebar filters shared by every page. Each widget is keyed by its filter, so
+# the selection made on one page is what the next page opens with. Pages
+# filtering on the same dimensions then build equal Filters, whose filtered
+# index and aggregates the engine already has cached.
+# With DASHBOARD_FILTER_URL=1 (the default) the filters are mirrored in the
+# query string too, so a copied link reopens the same view.
+SYNC_URL = os.environ.get("DASHBOARD_FILTER_URL", "1") == "1"
+PREFIX = "filter."
+SEEDED_KEY = PREFIX + "seeded"
+ALL = "All"
+NO_COMPARISON = "None"
+
+# Query parameters use the metrics API's names
+DIMENSION_PARAMS = {
+    "Product Category": "category",
+    "Customer Segment": "segment",
+    "State": "state",
+}
+PARAM_COLUMNS = {param: column for column, param in DIMENSION_PARAMS.items()}
+DATE_PARAMS = ["start", "end"]
+COMPARISON_PARAM = "compare"
+
+
+def _key(name):
+    return PREFIX + name
+
+
+def _options(column):
+    values = list(engine.dimension_values(column))
+    # States are picked from a long list, so they get an "All" shortcut
+    return [ALL] + values if column == "State" else values
+
+
+def _defaults():
+    return {
+        "dates": engine.date_bounds(),
+        **{
+            param: [ALL] if column == "State" else _options(column)
+            for column, param in DIMENSION_PARAMS.items()
+        },
+        "comparison": NO_COMPARISON,
+        "fast_preview": False,
+    }
+
+
+def _from_query_params(defaults):
+    # Values from a shared link; anything unknown or malformed is ignored
+    values = {}
+    min_date, max_date = defaults["dates"]
+    try:
+        start = date.fromisoformat(st.query_params.get("start", min_date.isoformat()))
+        end = date.fromisoformat(st.query_params.get("end", max_date.isoformat()))
+    except ValueError:
+        start, end = min_date, max_date
+    start, end = max(start, min_date), min(end, max_date)
+    if start <= end:
+        values["dates"] = (start, end)
+    for column, param in DIMENSION_PARAMS.items():
+        if param in st.query_params:
+            options = _options(column)
+            values[param] = [
+                value for value in st.query_params.get_all(param) if value in options
+            ]
+    if st.query_params.get(COMPARISON_PARAM) in engine.COMPARISONS:
+        values["comparison"] = st.query_params[COMPARISON_PARAM]
+    return values
+
+
+def init():
+    # Call on every page before its filter widgets. Streamlit forgets the state
+    # of widgets that a page doesn't draw, so every filter is carried over
+    # explicitly, including those this page has no widget for.
+    defaults = _defaults()
+    initial = dict(defaults)
+    if SEEDED_KEY not in st.session_state:
+        st.session_state[SEEDED_KEY] = True
+        if SYNC_URL:
+            initial |= _from_query_params(defaults)
+    for name, default in initial.items():
+        value = st.session_state.get(_key(name), default)
+        # Drop selections the current dataset no longer has
+        if name in PARAM_COLUMNS:
+            options = _options(PARAM_COLUMNS[name])
+            value = [v for v in value if v in options]
+        elif name == "dates":
+            min_date, max_date = defaults["dates"]
+            value = (max(value[0], min_date), min(value[1], max_date))
+            if value[0] > value[1]:
+                value = defaults["dates"]
+        st.session_state[_key(name)] = value
+    if SYNC_URL:
+        _update_query_params(defaults)
+
+
+def _update_query_params(defaults):
+    # Only filters that differ from the defaults go in the URL
+    params = {}
+    start, end = st.session_state[_key("dates")]
+    for param, value, default in zip(DATE_PARAMS, (start, end), defaults["dates"]):
+        if value != default:
+            params[param] = value.isoformat()
+    for param in DIMENSION_PARAMS.values():
+        selected = st.session_state[_key(param)]
+        if set(selected) != set(defaults[param]):
+            # An empty selection is kept as an empty value, not dropped
+            params[param] = selected or [""]
+    comparison = st.session_state[_key("comparison")]
+    if comparison != NO_COMPARISON:
+        params[COMPARISON_PARAM] = comparison
+
+    for param in DATE_PARAMS + list(DIMENSION_PARAMS.values()) + [COMPARISON_PARAM]:
+        if param in params:
+            if st.query_params.get_all(param) != _as_list(params[param]):
+                st.query_params[param] = params[param]
+        elif param in st.query_params:
+            del st.query_params[param]
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def date_range(label="Select Date Range:"):
+    min_date, max_date = engine.date_bounds()
+    return st.sidebar.slider(
+        label,
+        min_value=min_date,
+        max_value=max_date,
+        format="YYYY-MM-DD",
+        key=_key("dates"),
+    )
+
+
+def multiselect(column, label):
+    # The selected values, with "All" expanded to every value
+    selected = st.sidebar.multiselect(
+        label, _options(column), key=_key(DIMENSION_PARAMS[column])
+    )
+    if ALL in selected:
+        return list(engine.dimension_values(column))
+    return selected
+
+
+def comparison(label="Compare with"):
+    return st.sidebar.selectbox(
+        label, [NO_COMPARISON] + list(engine.COMPARISONS), key=_key("comparison")
+    )
+
+
+def format_change(changes, key, comparison):
+    # One kpi_changes() entry as HTML for a metric card: a colored arrow and
+    # the change against the named comparison window
+    if changes is None or changes[key] is None:
+        return f"no sales in the {comparison.lower()}"
+    change = changes[key]
+    arrow, color = ("▲", "green") if change >= 0 else ("▼", "red")
+    unit = " pts" if key == "avg_margin_pct" else "%"
+    return (
+        f"<span style='color:{color}'>{arrow} {abs(change):,.1f}{unit}</span> "
+        f"vs {comparison.lower()}"
+    )
+
+
+def fast_preview(label="⚡ Fast preview (approximate)"):
+    return st.sidebar.toggle(label, key=_key("fast_preview"))
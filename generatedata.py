@@ -1,3 +1,4 @@
+import argparse
 import random
 import csv
 from datetime import datetime, timedelta
@@ -120,68 +121,84 @@ def random_date_2024():
     return (start_date + timedelta(days=random_days)).strftime("%Y-%m-%d")
 
 
-num_rows = 1000
-order_id_start = 1001
-
-with open("dummy_sales_data.csv", "w", newline="") as f:
-    writer = csv.writer(f)
-    # Write header
-    writer.writerow(
-        [
-            "Date",
-            "Order ID",
-            "Customer Name",
-            "Customer Segment",
-            "City",
-            "State",
-            "Product Category",
-            "Product Sub-Category",
-            "Units Sold",
-            "Unit Cost",
-            "Unit Price",
-            "Total Cost",
-            "Total Sales",
-            "Margin",
-            "Margin %",
-        ]
-    )
+def generate_data(file_path="dummy_sales_data.csv", num_rows=1000, order_id_start=1001):
+    with open(file_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        # Write header
+        writer.writerow(
+            [
+                "Date",
+                "Order ID",
+                "Customer Name",
+                "Customer Segment",
+                "City",
+                "State",
+                "Product Category",
+                "Product Sub-Category",
+                "Units Sold",
+                "Unit Cost",
+                "Unit Price",
+                "Total Cost",
+                "Total Sales",
+                "Margin",
+                "Margin %",
+            ]
+        )
 
-    for i in range(num_rows):
-        order_id = f"ORD-{order_id_start + i}"
-        date = random_date_2024()
-        customer_name = f"{random.choice(first_names)} {random.choice(last_names)}"
-        segment = random.choice(segments)
-        city, state = random.choice(cities_states)
+        for i in range(num_rows):
+            order_id = f"ORD-{order_id_start + i}"
+            date = random_date_2024()
+            customer_name = f"{random.choice(first_names)} {random.choice(last_names)}"
+            segment = random.choice(segments)
+            city, state = random.choice(cities_states)
 
-        category = random.choice(list(categories.keys()))
-        sub_category = random.choice(categories[category])
+            category = random.choice(list(categories.keys()))
+            sub_category = random.choice(categories[category])
 
-        units_sold = random.randint(1, 100)
-        unit_cost = round(random.uniform(1.0, 600.0), 2)
-        # Ensure unit price is always higher than unit cost
-        unit_price = round(unit_cost + random.uniform(0.1, unit_cost), 2)
+            units_sold = random.randint(1, 100)
+            unit_cost = round(random.uniform(1.0, 600.0), 2)
+            # Ensure unit price is always higher than unit cost
+            unit_price = round(unit_cost + random.uniform(0.1, unit_cost), 2)
 
-        total_cost = units_sold * unit_cost
-        total_sales = units_sold * unit_price
-        margin = total_sales - total_cost
-        margin_percent = (margin / total_sales) * 100 if total_sales != 0 else 0
+            total_cost = units_sold * unit_cost
+            total_sales = units_sold * unit_price
+            margin = total_sales - total_cost
+            margin_percent = (margin / total_sales) * 100 if total_sales != 0 else 0
 
-        writer.writerow(
-            [
-                date,
-                order_id,
-                customer_name,
-                segment,
-                city,
-                state,
-                category,
-                sub_category,
-                units_sold,
-                unit_cost,
-                unit_price,
-                round(total_cost, 2),
-                round(total_sales, 2),
-                round(margin, 2),
-                f"{round(margin_percent,2)}%",
-            ]
-        )
+            writer.writerow(
+                [
+                    date,
+                    order_id,
+                    customer_name,
+                    segment,
+                    city,
+                    state,
+                    category,
+                    sub_category,
+                    units_sold,
+                    unit_cost,
+                    unit_price,
+                    round(total_cost, 2),
+                    round(total_sales, 2),
+                    round(margin, 2),
+                    f"{round(margin_percent,2)}%",
+                ]
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate dummy sales data.")
+    parser.add_argument("--output", default="dummy_sales_data.csv")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--order-id-start", type=int, default=1001)
+    parser.add_argument(
+        "--partition-dir",
+        help="Also write the data as monthly Parquet partitions to this directory.",
+    )
+    args = parser.parse_args()
+
+    generate_data(args.output, args.rows, args.order_id_start)
+    if args.partition_dir:
+        import engine
+
+        engine.write_partitions(engine.read_sales(args.output), args.partition_dir)
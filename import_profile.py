@@ -0,0 +1,86 @@
+import argparse
+import ast
+import glob
+import os
+import subprocess
+import sys
+
+# Import-time profile of each page on a cold worker. The Streamlit server has
+# already imported streamlit when a page first runs, so it is imported up
+# front and left out of the totals. A page's shell imports are those before
+# its attach_data() call; everything imported after it is deferred until the
+# title and sidebar are on screen.
+PAGES = ["Home.py"] + sorted(glob.glob(os.path.join("pages", "*.py")))
+MARKER = "-- deferred --"
+
+
+def page_imports(path):
+    # Module-level import statements, split at the attach_data() call
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    shell, deferred = [], []
+    current = shell
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            current.append(ast.unparse(node))
+        elif "attach_data(" in ast.unparse(node):
+            current = deferred
+    return shell, deferred
+
+
+def parse_importtime(stderr):
+    # Cumulative microseconds of each top-level import, per group
+    groups = {"shell": {}, "deferred": {}}
+    group = groups["shell"]
+    for line in stderr.splitlines():
+        if line == MARKER:
+            group = groups["deferred"]
+            continue
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith("  "):
+            continue
+        group[name.strip()] = int(cumulative)
+    return groups
+
+
+def profile_page(path):
+    shell, deferred = page_imports(path)
+    code = "\n".join(
+        ["import streamlit", "import sys", "sys.stderr.write('-- baseline --\\n')"]
+        + shell
+        + [f"sys.stderr.write({MARKER!r} + '\\n')"]
+        + deferred
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+        check=True,
+    )
+    # Drop streamlit and the interpreter's own imports before the baseline
+    stderr = result.stderr.split("-- baseline --\n", 1)[1]
+    return parse_importtime(stderr)
+
+
+def format_group(modules, top):
+    ranked = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    detail = ", ".join(f"{name} {us / 1000:.0f}" for name, us in ranked[:top])
+    return f"{sum(modules.values()) / 1000:7.0f} ms  {detail}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the import time each page adds on a cold worker."
+    )
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    for path in args.pages:
+        groups = profile_page(path)
+        print(path)
+        for group, modules in groups.items():
+            print(f"  {group:<9}{format_group(modules, args.top)}")
@@ -0,0 +1,304 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Instrumentation is opt-in: set DASHBOARD_INSTRUMENTATION=1 or open a page
+# with ?debug=1. When DASHBOARD_INSTRUMENTATION_DIR is set, every rerun is also
+# appended to stages.jsonl and metrics.prom in that directory.
+ENV_FLAG = "DASHBOARD_INSTRUMENTATION"
+ENV_DIR = "DASHBOARD_INSTRUMENTATION_DIR"
+SESSION_KEY = "_instrumentation"
+HISTORY_KEY = "_instrumentation_history"
+HISTORY_SIZE = 50
+
+METRICS = [
+    ("seconds", "Wall time spent in a dashboard stage."),
+    ("rows_in", "Rows entering a dashboard stage."),
+    ("rows_out", "Rows leaving a dashboard stage."),
+    ("alloc_bytes", "Peak bytes allocated while a dashboard stage ran."),
+]
+
+# Process-wide totals across all sessions, exported as Prometheus counters
+_totals = {}
+_totals_lock = threading.Lock()
+
+# Instrumented reruns in progress, by rerun_id. tracemalloc runs only while
+# there are any, so sessions without ?debug=1 don't pay for tracing once the
+# debugging session is done. A rerun a newer one interrupted is dropped when
+# its session starts the next; one whose session went away expires.
+ACTIVE_TIMEOUT_S = 600
+_active = {}
+_active_lock = threading.Lock()
+# The stages open on each script thread, outermost first
+_open = threading.local()
+
+
+def enabled():
+    if os.environ.get(ENV_FLAG) == "1":
+        return True
+    try:
+        return st.query_params.get("debug") == "1"
+    except Exception:
+        return False
+
+
+def _start_tracing(rerun_id):
+    with _active_lock:
+        _active[rerun_id] = time.monotonic()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def _stop_tracing(rerun_id):
+    with _active_lock:
+        _active.pop(rerun_id, None)
+        expired = time.monotonic() - ACTIVE_TIMEOUT_S
+        for stale in [key for key, started in _active.items() if started < expired]:
+            del _active[stale]
+        if not _active and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def start_rerun(page):
+    # Call once at the top of a page script to begin a new set of stage records
+    previous = st.session_state.pop(SESSION_KEY, None)
+    if enabled():
+        rerun = {
+            "rerun_id": uuid.uuid4().hex,
+            "page": page,
+            "started_at": time.time(),
+            "stages": [],
+        }
+        _start_tracing(rerun["rerun_id"])
+        st.session_state[SESSION_KEY] = rerun
+    # Interrupted before render_debug_panel() closed it
+    if previous is not None and not previous.get("finished"):
+        _stop_tracing(previous["rerun_id"])
+
+
+def _current_rerun():
+    try:
+        return st.session_state.get(SESSION_KEY)
+    except Exception:
+        return None
+
+
+def _rows(obj):
+    # Checked by name so pages can time stages before pandas is imported
+    if type(obj).__name__ in ("DataFrame", "Series"):
+        return len(obj)
+    return None
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    # Time a block of page code. Set record["rows_out"] inside the block to
+    # report how many rows the stage produced.
+    record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+    rerun = _current_rerun()
+    if rerun is None:
+        yield record
+        return
+
+    # tracemalloc is process-wide, so allocations from concurrent sessions
+    # can leak into each other's numbers. It has one peak, which each stage
+    # resets, so the peak so far is handed to the enclosing stages first.
+    stack = _open.__dict__.setdefault("stack", [])
+    _note_peak(stack)
+    tracemalloc.reset_peak()
+    alloc_start, _ = tracemalloc.get_traced_memory()
+    frame = {"start": alloc_start, "peak": alloc_start}
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        _note_peak(stack)
+        stack.pop()
+        record["alloc_bytes"] = max(frame["peak"] - frame["start"], 0)
+        rerun["stages"].append(record)
+
+
+def _note_peak(stack):
+    _, peak = tracemalloc.get_traced_memory()
+    for frame in stack:
+        frame["peak"] = max(frame["peak"], peak)
+
+
+def record_stage(name, seconds, result=None, rows_in=None):
+    # Record a stage timed elsewhere, such as a job on the shared pool. Its
+    # allocations can't be told apart from the rest of the process, so
+    # alloc_bytes is left unset.
+    rerun = _current_rerun()
+    if rerun is None:
+        return
+    rerun["stages"].append(
+        {
+            "stage": name,
+            "rows_in": rows_in,
+            "rows_out": _rows(result),
+            "seconds": seconds,
+            "alloc_bytes": None,
+        }
+    )
+
+
+def to_jsonl(reruns):
+    lines = []
+    for rerun in reruns:
+        for record in rerun["stages"]:
+            lines.append(
+                json.dumps(
+                    {
+                        "rerun_id": rerun["rerun_id"],
+                        "page": rerun["page"],
+                        "started_at": rerun["started_at"],
+                        **record,
+                    }
+                )
+            )
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _labels(page, stage_name):
+    return f'page="{page}",stage="{stage_name}"'
+
+
+def to_prometheus(rerun):
+    # Gauges describing a single rerun
+    lines = []
+    for metric, help_text in METRICS:
+        lines.append(f"# HELP dashboard_stage_{metric} {help_text}")
+        lines.append(f"# TYPE dashboard_stage_{metric} gauge")
+        for record in rerun["stages"]:
+            value = record.get(metric)
+            if value is not None:
+                labels = _labels(rerun["page"], record["stage"])
+                lines.append(f"dashboard_stage_{metric}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def totals_to_prometheus():
+    # Counters accumulated over every instrumented rerun in this process
+    with _totals_lock:
+        totals = dict(_totals)
+    lines = [
+        "# HELP dashboard_stage_seconds_total Total wall time spent in a stage.",
+        "# TYPE dashboard_stage_seconds_total counter",
+    ]
+    for (page, stage_name), (count, seconds, _) in sorted(totals.items()):
+        lines.append(
+            f"dashboard_stage_seconds_total{{{_labels(page, stage_name)}}} {seconds}"
+        )
+    lines += [
+        "# HELP dashboard_stage_runs_total Number of times a stage ran.",
+        "# TYPE dashboard_stage_runs_total counter",
+    ]
+    for (page, stage_name), (count, seconds, _) in sorted(totals.items()):
+        lines.append(
+            f"dashboard_stage_runs_total{{{_labels(page, stage_name)}}} {count}"
+        )
+    lines += [
+        "# HELP dashboard_stage_alloc_bytes_total Total bytes allocated in a stage.",
+        "# TYPE dashboard_stage_alloc_bytes_total counter",
+    ]
+    for (page, stage_name), (count, seconds, alloc) in sorted(totals.items()):
+        lines.append(
+            f"dashboard_stage_alloc_bytes_total{{{_labels(page, stage_name)}}} {alloc}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _record_totals(rerun):
+    with _totals_lock:
+        for record in rerun["stages"]:
+            key = (rerun["page"], record["stage"])
+            count, seconds, alloc = _totals.get(key, (0, 0.0, 0))
+            _totals[key] = (
+                count + 1,
+                seconds + record["seconds"],
+                alloc + (record["alloc_bytes"] or 0),
+            )
+
+
+def _write_files(rerun):
+    out_dir = os.environ.get(ENV_DIR)
+    if not out_dir:
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "stages.jsonl"), "a") as f:
+        f.write(to_jsonl([rerun]))
+    # Write then rename so a scraper never reads a half-written file
+    prom_path = os.path.join(out_dir, "metrics.prom")
+    with open(prom_path + ".tmp", "w") as f:
+        f.write(totals_to_prometheus())
+    os.replace(prom_path + ".tmp", prom_path)
+
+
+def render_debug_panel():
+    # Call once at the bottom of a page script to close the rerun and show
+    # its stage timings in the sidebar
+    rerun = _current_rerun()
+    if rerun is None or rerun.get("finished"):
+        return
+    rerun["finished"] = True
+    _stop_tracing(rerun["rerun_id"])
+
+    history = st.session_state.setdefault(HISTORY_KEY, [])
+    history.append(rerun)
+    del history[:-HISTORY_SIZE]
+    _record_totals(rerun)
+    _write_files(rerun)
+
+    import pandas as pd
+
+    import engine
+    import planner
+
+    with st.sidebar.expander("🛠️ Debug: stage timings", expanded=True):
+        if not rerun["stages"]:
+            st.write("No stages recorded in this rerun.")
+            return
+        stages_df = pd.DataFrame(rerun["stages"])
+        st.metric("Rerun total", f"{stages_df['seconds'].sum() * 1000:,.1f} ms")
+        stages_df["ms"] = stages_df["seconds"] * 1000
+        stages_df["alloc MB"] = stages_df["alloc_bytes"] / 1e6
+        st.dataframe(
+            stages_df[["stage", "ms", "rows_in", "rows_out", "alloc MB"]],
+            hide_index=True,
+            column_config={
+                "ms": st.column_config.NumberColumn(format="%.1f"),
+                "alloc MB": st.column_config.NumberColumn(format="%.2f"),
+            },
+        )
+        for file_path, report in engine.memory_reports().items():
+            st.caption(
+                f"{file_path}: {report['rows']:,} rows, "
+                f"{report['before_bytes'] / 1e6:,.1f} MB raw -> "
+                f"{report['after_bytes'] / 1e6:,.1f} MB compact"
+            )
+        # Which source the query planner used, over all sessions
+        for source, stats in planner.source_stats().items():
+            st.caption(
+                f"Planner {source}: {stats['queries']:,} queries, "
+                f"{stats['avg_ms']:,.2f} ms avg"
+            )
+        st.download_button(
+            "Download Prometheus metrics",
+            to_prometheus(rerun),
+            file_name=f"{rerun['page']}_metrics.prom",
+            mime="text/plain",
+        )
+        st.download_button(
+            f"Download JSONL (last {len(history)} reruns)",
+            to_jsonl(history),
+            file_name="stages.jsonl",
+            mime="application/jsonl",
+        )
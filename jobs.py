@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent import futures
+
+from instrumentation import record_stage
+
+# Aggregations run on one bounded pool shared by every session of the process,
+# so an expensive query queues for a worker instead of running alongside all
+# the others. Threads rather than processes: jobs read the engine's in-process
+# caches and fill them with their results, and pandas releases the GIL for much
+# of a groupby.
+MAX_WORKERS = int(os.environ.get("DASHBOARD_JOB_WORKERS", "4"))
+# A newer rerun only interrupts a waiting one at an st call, so the status line
+# is redrawn this often while results are outstanding
+POLL_S = 0.1
+
+_executor = futures.ThreadPoolExecutor(
+    max_workers=MAX_WORKERS, thread_name_prefix="jobs"
+)
+# In-flight jobs by (fn, args), and how many reruns are waiting on each
+_jobs = {}
+_waiters = {}
+# Reentrant: cancelling a job runs its _forget() callback on the same thread
+_lock = threading.RLock()
+
+
+class Batch:
+    # The jobs one rerun is waiting for. Identical requests from any session
+    # share a job; when the rerun ends, including when a newer rerun interrupts
+    # it, jobs that nobody else is waiting for are cancelled if they haven't
+    # started yet.
+    def __init__(self):
+        self.keys = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def submit(self, fn, *args):
+        key = (fn, args)
+        with _lock:
+            future = _jobs.get(key)
+            created = future is None
+            if created:
+                future = _executor.submit(_timed, fn, args)
+                _jobs[key] = future
+            _waiters[key] = _waiters.get(key, 0) + 1
+        self.keys.append(key)
+        if created:
+            # The callback runs immediately if the job already ended
+            future.add_done_callback(lambda done: _forget(key, done))
+        return future
+
+    def release(self):
+        with _lock:
+            for key in self.keys:
+                _waiters[key] -= 1
+                if not _waiters[key]:
+                    del _waiters[key]
+                    future = _jobs.get(key)
+                    # cancel() runs _forget(), which drops the job. A job
+                    # already running can't be cancelled: it stays in _jobs so
+                    # a rerun asking again shares it, and leaves its result in
+                    # the engine caches.
+                    if future is not None:
+                        future.cancel()
+        self.keys = []
+
+    def as_completed(self, jobs, status_slot=None, status=None):
+        # Yield (name, result) for a dict of named jobs in the order they
+        # finish, so each result can be drawn as soon as it is ready. Each job
+        # is recorded as an aggregate.<name> stage with its time on the pool;
+        # tuple names are joined with dots.
+        pending = {future: name for name, future in jobs.items()}
+        started = time.perf_counter()
+        while pending:
+            done, _ = futures.wait(
+                pending, timeout=POLL_S, return_when=futures.FIRST_COMPLETED
+            )
+            if status_slot is not None and not done:
+                ready = len(jobs) - len(pending)
+                status_slot.caption(
+                    f"{status or 'Computing'}... {ready} of {len(jobs)} ready, "
+                    f"{time.perf_counter() - started:.1f}s"
+                )
+            # Submission order among jobs that finished together
+            for future in sorted(done, key=list(pending).index):
+                name = pending.pop(future)
+                result, seconds = future.result()
+                label = name if isinstance(name, str) else ".".join(map(str, name))
+                record_stage(f"aggregate.{label}", seconds, result)
+                yield name, result
+        if status_slot is not None:
+            status_slot.empty()
+
+
+def _timed(fn, args):
+    # The result and the seconds the job took on its worker, excluding the
+    # time it queued
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def _forget(key, future):
+    # Finished results live on in the engine caches. A cancelled job may
+    # already have been replaced by a new one for the same query.
+    with _lock:
+        if _jobs.get(key) is future:
+            del _jobs[key]
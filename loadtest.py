@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetStates
+from streamlit.testing.v1.element_tree import parse_tree_from_messages
+from websockets.sync.client import connect
+
+# Load test for one dashboard replica. A real `streamlit run` server is started
+# (or an existing one targeted with --url) and N sessions connect over its
+# websocket like browsers do: each opens Home, then makes random filter changes
+# and page switches. Reruns of all sessions execute in the server process,
+# contending for its GIL and sharing its engine caches, and each is timed
+# from sending the change to the script finishing.
+DEFAULT_SESSIONS = [1, 4, 16]
+DEFAULT_PORT = 8599
+PERCENTILES = [50, 95, 99]
+# A rerun slower than this counts as a failure rather than hanging the run
+RERUN_TIMEOUT_S = 300
+SERVER_START_TIMEOUT_S = 60
+HOME = "Home"
+
+
+def rss_bytes(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def latency_summary(seconds):
+    if not seconds:
+        return {}
+    values = np.percentile(np.array(seconds) * 1000, PERCENTILES)
+    return {f"p{p}_ms": float(v) for p, v in zip(PERCENTILES, values)} | {
+        "max_ms": max(seconds) * 1000,
+        "reruns": len(seconds),
+    }
+
+
+def start_server(port, data=None):
+    env = dict(os.environ)
+    if data:
+        env["DASHBOARD_DATA"] = data
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            "Home.py",
+            "--server.headless=true",
+            f"--server.port={port}",
+            "--browser.gatherUsageStats=false",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health"):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("streamlit exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"streamlit didn't start within {SERVER_START_TIMEOUT_S}s")
+
+
+class Session:
+    # One browser tab: sends rerun requests with the widget changes and the
+    # page to run, and reads messages until the script has finished
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.page_hash = ""
+        self.query_string = ""
+        self.pages = {}
+        self.tree = None
+        # Toggle values this session has set, by widget id
+        self.values = {}
+
+    def rerun(self, widget_states=None):
+        request = BackMsg()
+        request.rerun_script.query_string = self.query_string
+        request.rerun_script.page_script_hash = self.page_hash
+        if widget_states is not None:
+            request.rerun_script.widget_states.CopyFrom(widget_states)
+        self.websocket.send(request.SerializeToString())
+
+        deltas = []
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(self.websocket.recv(timeout=RERUN_TIMEOUT_S))
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # A rerun requested by the script itself starts over
+                deltas = []
+                self.page_hash = msg.new_session.page_script_hash
+            elif kind == "navigation":
+                self.pages = {
+                    page.url_pathname or HOME: page.page_script_hash
+                    for page in msg.navigation.app_pages
+                }
+            elif kind == "page_info_changed":
+                self.query_string = msg.page_info_changed.query_string
+            elif kind == "delta":
+                deltas.append(msg)
+            elif kind == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+        self.tree = parse_tree_from_messages(deltas)
+        if self.tree.exception:
+            return self.tree.exception[0].message
+        return None
+
+    def page(self):
+        return next(
+            (name for name, page in self.pages.items() if page == self.page_hash),
+            HOME,
+        )
+
+    def switch_page(self, name):
+        # The browser drops the query string when moving between pages
+        self.page_hash = self.pages[name]
+        self.query_string = ""
+
+    def random_change(self, rng):
+        # Pick one widget on the current page and a random value for it, and
+        # return its label with the widget states to send. Values are encoded
+        # the way the browser sends them; widgets left out keep the value the
+        # server already holds.
+        widgets = (
+            list(self.tree.multiselect)
+            + list(self.tree.slider)
+            + list(self.tree.selectbox)
+            + list(self.tree.toggle)
+            + list(self.tree.radio)
+        )
+        if not widgets:
+            return None, None
+        widget = rng.choice(widgets)
+        proto = widget.proto
+        states = WidgetStates()
+        state = states.widgets.add()
+        state.id = proto.id
+        kind = type(widget).__name__
+        if kind == "Multiselect":
+            options = list(proto.options)
+            state.string_array_value.data[:] = rng.sample(
+                options, rng.randint(1, len(options))
+            )
+        elif kind == "Slider":
+            # Date sliders count in microseconds with a step of one day
+            steps = int((proto.max - proto.min) // proto.step)
+            picks = sorted(rng.sample(range(steps + 1), len(proto.default)))
+            state.double_array_value.data[:] = [
+                proto.min + pick * proto.step for pick in picks
+            ]
+        elif kind == "Toggle":
+            state.bool_value = not self.values.get(proto.id, proto.default)
+            self.values[proto.id] = state.bool_value
+        else:
+            state.string_value = rng.choice(list(proto.options))
+        return proto.label, states
+
+
+def run_session(url, session_id, actions, switch_prob, seed, records, hold=None):
+    # hold is a (finished, release) pair: the session stays connected after
+    # its last rerun until the memory of all sessions has been measured
+    rng = random.Random(seed * 1000 + session_id)
+    try:
+        with connect(url, subprotocols=["streamlit"], max_size=None) as websocket:
+            session = Session(websocket)
+            for step in range(actions + 1):
+                widget_states, action = None, "open"
+                if step and rng.random() < switch_prob:
+                    action = "switch_page"
+                    session.switch_page(rng.choice(list(session.pages)))
+                elif step:
+                    action, widget_states = session.random_change(rng)
+                    action = action or "rerun"
+                start = time.perf_counter()
+                failed = False
+                try:
+                    error = session.rerun(widget_states)
+                except Exception as exc:
+                    # The connection is out of step with the server after this
+                    error, failed = f"{type(exc).__name__}: {exc}", True
+                records.append(
+                    {
+                        "session": session_id,
+                        "page": session.page(),
+                        "action": action,
+                        "seconds": time.perf_counter() - start,
+                        "error": error,
+                    }
+                )
+                if failed:
+                    break
+            if hold is not None:
+                _hold(*hold)
+    finally:
+        # A session that failed to connect must not keep the others waiting
+        if hold is not None and not hold[1].is_set():
+            _hold(*hold)
+
+
+def _hold(finished, release):
+    try:
+        finished.wait()
+    except threading.BrokenBarrierError:
+        pass
+    release.wait()
+
+
+def run_level(url, pid, sessions, actions, switch_prob, seed):
+    # All sessions start together and stay connected until every one has
+    # finished, so the memory they hold is measured at the same time
+    records = []
+    finished, release = threading.Barrier(sessions + 1), threading.Event()
+    rss_before = rss_bytes(pid) if pid else None
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(url, session_id, actions, switch_prob, seed, records),
+            kwargs={"hold": (finished, release)},
+            name=f"session-{session_id}",
+        )
+        for session_id in range(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    finished.wait()
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes(pid) if pid else None
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    by_page = {}
+    for record in records:
+        by_page.setdefault(record["page"], []).append(record["seconds"])
+    errors = [record for record in records if record["error"]]
+    result = {
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "reruns_per_s": len(records) / elapsed,
+        "latency": latency_summary([record["seconds"] for record in records]),
+        "latency_by_page": {
+            page: latency_summary(seconds) for page, seconds in sorted(by_page.items())
+        },
+        "errors": len(errors),
+        "error_samples": [
+            {key: record[key] for key in ("page", "action", "error")}
+            for record in errors[:5]
+        ],
+    }
+    if pid:
+        result |= {
+            "rss_before_mb": rss_before / 1e6,
+            "rss_after_mb": rss_after / 1e6,
+            "mb_per_session": (rss_after - rss_before) / 1e6 / sessions,
+        }
+    return result
+
+
+def warm_up(url):
+    # One session visits every page so the levels measure steady-state reruns
+    # rather than the first load and imports
+    with connect(url, subprotocols=["streamlit"], max_size=None) as websocket:
+        session = Session(websocket)
+        session.rerun()
+        for page in list(session.pages):
+            session.switch_page(page)
+            session.rerun()
+
+
+def run_loadtest(url, pid, levels, actions=20, switch_prob=0.2, seed=0):
+    warm_up(url)
+    warm_rss = rss_bytes(pid) if pid else None
+    results = []
+    for sessions in levels:
+        result = run_level(url, pid, sessions, actions, switch_prob, seed)
+        results.append(result)
+        latency = result["latency"]
+        memory = (
+            f", {result['mb_per_session']:+.1f} MB/session" if pid is not None else ""
+        )
+        print(
+            f"{sessions:>4} sessions: p50={latency['p50_ms']:,.0f}ms "
+            f"p95={latency['p95_ms']:,.0f}ms p99={latency['p99_ms']:,.0f}ms, "
+            f"{result['reruns_per_s']:.1f} reruns/s{memory}, "
+            f"{result['errors']} errors"
+        )
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "url": url,
+        "actions_per_session": actions,
+        "switch_prob": switch_prob,
+        "seed": seed,
+        "warm_rss_mb": warm_rss / 1e6 if pid else None,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive a dashboard replica with many concurrent sessions and "
+        "report rerun latency and memory per session."
+    )
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS)
+    parser.add_argument(
+        "--actions", type=int, default=20, help="Reruns per session after opening."
+    )
+    parser.add_argument(
+        "--switch-prob",
+        type=float,
+        default=0.2,
+        help="Chance that an action switches page rather than changing a widget.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--url",
+        default=None,
+        help="Websocket URL of a running replica (ws://host:port/_stcore/stream). "
+        "By default a server is started on --port.",
+    )
+    parser.add_argument(
+        "--pid", type=int, default=None, help="Process ID of --url, for memory."
+    )
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", default=None, help="Overrides DASHBOARD_DATA.")
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        server = start_server(args.port, args.data)
+        url, pid = f"ws://127.0.0.1:{args.port}/_stcore/stream", server.pid
+    try:
+        report = run_loadtest(
+            url, pid, args.sessions, args.actions, args.switch_prob, args.seed
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    report["data"] = args.data or os.environ.get("DASHBOARD_DATA")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
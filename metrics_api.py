@@ -0,0 +1,238 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import engine
+import export
+
+# Query parameters accepted by every endpoint, mapped to make_filters() arguments
+FILTER_PARAMS = {
+    "category": "categories",
+    "segment": "segments",
+    "state": "states",
+}
+
+METRICS = {
+    "kpis": None,
+    "sales-over-time": None,
+    "by-category": "Product Category",
+    "by-sub-category": "Product Sub-Category",
+    "by-state": "State",
+    "by-segment": "Customer Segment",
+}
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_filters(params):
+    # params maps a name to a list of values, as returned by parse_qs or sent
+    # in a batch request
+    def first(name):
+        values = params.get(name)
+        if isinstance(values, list):
+            values = values[0] if values else None
+        return values or None
+
+    kwargs = {"start_date": first("start"), "end_date": first("end")}
+    for param, argument in FILTER_PARAMS.items():
+        values = params.get(param)
+        if values is not None:
+            kwargs[argument] = [values] if isinstance(values, str) else values
+    try:
+        return engine.make_filters(**kwargs)
+    except (TypeError, ValueError) as e:
+        raise QueryError(f"Invalid filters: {e}")
+
+
+def _records(df):
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime("%Y-%m-%d")
+    return df.to_dict(orient="records")
+
+
+@engine.memoized(maxsize=4096)
+def run_query(metric, filters, freq="D", file_path=engine.DATA_FILE):
+    # JSON-ready results are cached on top of the engine's own caches so
+    # repeated queries skip the DataFrame conversion as well
+    if metric not in METRICS:
+        raise QueryError(f"Unknown metric: {metric}")
+    if freq not in engine.FREQUENCIES.values():
+        raise QueryError(f"Unknown frequency: {freq}")
+
+    if metric == "kpis":
+        return engine.kpis(filters, file_path)
+    if metric == "sales-over-time":
+        sales = engine.sales_over_time(filters, file_path)
+        if freq != "D":
+            sales = (
+                sales.assign(Date=sales["Date"].dt.to_period(freq).dt.to_timestamp())
+                .groupby("Date", as_index=False)["Total Sales"]
+                .sum()
+            )
+        return _records(sales)
+    return _records(engine.sales_by(METRICS[metric], filters, file_path))
+
+
+def parse_batch_query(query):
+    # One entry of a batch request as (metric, filters, freq). The types are
+    # checked here, so a malformed entry fails on its own with a QueryError.
+    if not isinstance(query, dict):
+        raise QueryError("Each query must be a JSON object")
+    metric = query.get("metric")
+    freq = query.get("freq", "D")
+    params = query.get("filters", {})
+    for name, value in [("metric", metric), ("freq", freq)]:
+        if not isinstance(value, str):
+            raise QueryError(f"'{name}' must be a string")
+    if not isinstance(params, dict):
+        raise QueryError("'filters' must be a JSON object")
+    for name, values in params.items():
+        if values is None:
+            continue
+        if not all(
+            isinstance(value, str)
+            for value in (values if isinstance(values, list) else [values])
+        ):
+            raise QueryError(f"Filter '{name}' must be a string or list of strings")
+    return metric, parse_filters(params), freq
+
+
+def run_batch(queries, file_path=engine.DATA_FILE):
+    results = []
+    for query in queries:
+        try:
+            metric, filters, freq = parse_batch_query(query)
+            results.append({"result": run_query(metric, filters, freq, file_path)})
+        except QueryError as e:
+            results.append({"error": str(e)})
+    return results
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    file_path = engine.DATA_FILE
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        metric = url.path.strip("/")
+        if metric == "health":
+            self._send_json(200, {"status": "ok"})
+            return
+        if metric == "ready":
+            # Not ready while the cache warmer is still running
+            import warmup
+
+            current = warmup.status()
+            self._send_json(503 if current["state"] == "running" else 200, current)
+            return
+        if metric == "export":
+            self._send_export(parse_qs(url.query))
+            return
+        if metric not in METRICS:
+            self._send_json(404, {"error": f"Unknown endpoint: /{metric}"})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            filters = parse_filters(params)
+            freq = params.get("freq", ["D"])[0]
+            result = run_query(metric, filters, freq, self.file_path)
+        except QueryError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, result)
+
+    def _send_export(self, params):
+        # GET /export?format=csv|parquet|xlsx plus the usual filters. Rows are
+        # written chunk by chunk as they are encoded; with no Content-Length
+        # the response ends when the connection closes.
+        fmt = params.get("format", ["csv"])[0]
+        try:
+            filters = parse_filters(params)
+            export.check_export(fmt, filters, self.file_path)
+        except (QueryError, export.ExportError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", export.FORMATS[fmt][1])
+        self.send_header(
+            "Content-Disposition",
+            f'attachment; filename="{export.export_file_name("filtered", fmt)}"',
+        )
+        self.end_headers()
+        try:
+            export.WRITERS[fmt](filters, self.wfile, self.file_path)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the download
+            pass
+
+    def do_POST(self):
+        # POST /batch with {"queries": [{"metric": ..., "filters": {...}}, ...]}
+        if urlparse(self.path).path.strip("/") != "batch":
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            queries = json.loads(self.rfile.read(length))["queries"]
+            if not isinstance(queries, list):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": "Expected a JSON body with 'queries'"})
+            return
+        self._send_json(200, {"results": run_batch(queries, self.file_path)})
+
+    def log_message(self, format, *args):
+        # Keep high-volume batch traffic out of the Streamlit log
+        pass
+
+
+def make_server(host="127.0.0.1", port=8502, file_path=engine.DATA_FILE):
+    handler = type("Handler", (MetricsHandler,), {"file_path": file_path})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_in_background(host="127.0.0.1", port=8502, file_path=engine.DATA_FILE):
+    # Start the API on a daemon thread once per process; later calls are no-ops
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = make_server(host, port, file_path)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve dashboard metrics as JSON without Streamlit."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--data", default=engine.DATA_FILE)
+    args = parser.parse_args()
+
+    # Warm the caches up front so the first request doesn't pay for them
+    import warmup
+
+    warmup.start_background_warmup(args.data)
+    server = make_server(args.host, args.port, args.data)
+    print(f"Serving metrics on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,27 @@
+import streamlit as st
+
+from instrumentation import stage
+
+# Pages draw their title and sidebar header before calling attach_data() and
+# import engine and the charting libraries after it. pandas alone takes a few
+# hundred milliseconds to import, and parsing the data seconds, so on a cold
+# worker the page is on screen while they load. Later reruns find everything
+# already imported and loaded. Run import_profile.py for the breakdown.
+
+
+def attach_data():
+    progress = st.empty()
+    progress.progress(0.0, text="Loading libraries…")
+    with stage("import"):
+        import engine
+        import warmup
+
+    # Precompute the default views of every page off the request path
+    warmup.start_background_warmup()
+
+    progress.progress(0.5, text="Attaching sales data…")
+    with stage("load") as s:
+        total_rows = engine.dataset_rows()
+        s["rows_out"] = total_rows
+    progress.empty()
+    return total_rows
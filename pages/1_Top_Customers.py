@@ -1,20 +1,38 @@
-import pandas as pd
-import plotly.express as px
 import streamlit as st
 
-# Load your data
-df = pd.read_csv("dummy_sales_data.csv")
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
+
+start_rerun("top_customers")
+
+st.markdown("# 🏆 Top Customers")
+st.sidebar.header("Customer Filters")
+
+total_rows = attach_data()
+
+# Imported once the shell above is on screen
+import altair as alt
+import plotly.express as px
+
+import customers
+import engine
+from export import render_export_panel
 
 # Top 5 customers by Total Sales
-top_customers_sales = df.nlargest(5, "Total Sales").sort_values(
-    by="Total Sales", ascending=True
-)
+with stage("aggregate.top_sales", total_rows) as s:
+    top_customers_sales = engine.top_orders("Total Sales", 5).sort_values(
+        by="Total Sales", ascending=True
+    )
+    s["rows_out"] = len(top_customers_sales)
 
 # Top 5 customers by Margin
-top_customers_profit = df.nlargest(5, "Margin").sort_values(by="Margin", ascending=True)
+with stage("aggregate.top_margin", total_rows) as s:
+    top_customers_profit = engine.top_orders("Margin", 5).sort_values(
+        by="Margin", ascending=True
+    )
+    s["rows_out"] = len(top_customers_profit)
 
 # Streamlit app content
-st.markdown("# 🏆 Top Customers")
 st.markdown("## Top 5 Customers by Total Sales")
 fig_sales = px.bar(
     top_customers_sales,
@@ -23,7 +41,8 @@ fig_sales = px.bar(
     title="Top 5 Customers by Total Sales",
     orientation="h",
 )
-st.plotly_chart(fig_sales)
+with stage("render.top_sales"):
+    st.plotly_chart(fig_sales)
 
 st.markdown("## Top 5 Customers by Margin")
 fig_profit = px.bar(
@@ -33,4 +52,132 @@ fig_profit = px.bar(
     title="Top 5 Customers by Margin",
     orientation="h",
 )
-st.plotly_chart(fig_profit)
+with stage("render.top_margin"):
+    st.plotly_chart(fig_profit)
+
+st.markdown("---")
+st.markdown("# 👥 Customer Analytics")
+
+# Customer filters. Segment and state are those of each customer's latest
+# order; the date range selects customers by their first order.
+min_date, max_date = engine.date_bounds()
+first_start, first_end = st.sidebar.slider(
+    "First Order Between:",
+    min_value=min_date,
+    max_value=max_date,
+    value=(min_date, max_date),
+    format="YYYY-MM-DD",
+)
+segments = list(engine.dimension_values("Customer Segment"))
+selected_segments = st.sidebar.multiselect(
+    "Choose Customer Segments", segments, default=segments
+)
+states = list(engine.dimension_values("State"))
+selected_states = st.sidebar.multiselect("Choose States", ["All"] + states, ["All"])
+if "All" in selected_states:
+    selected_states = states
+bucket_names = [name for name, _ in customers.RFM_BUCKETS] + [customers.OTHER_BUCKET]
+selected_buckets = st.sidebar.multiselect(
+    "Choose RFM Buckets", bucket_names, default=bucket_names
+)
+buckets = tuple(selected_buckets) if len(selected_buckets) < len(bucket_names) else None
+
+customer_filters = engine.make_filters(
+    first_start, first_end, segments=selected_segments, states=selected_states
+)
+with stage("aggregate.customers") as s:
+    selected_customers = customers.filter_customers(customer_filters, buckets)
+    s["rows_out"] = len(selected_customers)
+
+if selected_customers.empty:
+    st.write("No customers match the selected filters.")
+else:
+    # Top customers by lifetime value
+    rank_by = st.radio(
+        "Rank Customers By:", ["Total Sales", "Margin", "Orders"], horizontal=True
+    )
+    top = selected_customers.nlargest(10, rank_by)
+    st.markdown(f"## Top 10 Customers by {rank_by}")
+    fig_customers = px.bar(
+        top.sort_values(rank_by),
+        x=rank_by,
+        y="Customer Name",
+        color="Bucket",
+        orientation="h",
+        hover_data=["Orders", "Last Order", "RFM"],
+    )
+    with stage("render.top_customers"):
+        st.plotly_chart(fig_customers)
+        st.dataframe(
+            top[
+                [
+                    "Customer Name",
+                    "Customer Segment",
+                    "State",
+                    "First Order",
+                    "Last Order",
+                    "Orders",
+                    "Total Sales",
+                    "Margin",
+                    "RFM",
+                    "Bucket",
+                ]
+            ],
+            hide_index=True,
+            column_config={
+                "First Order": st.column_config.DateColumn(format="YYYY-MM-DD"),
+                "Last Order": st.column_config.DateColumn(format="YYYY-MM-DD"),
+                "Total Sales": st.column_config.NumberColumn(format="$%.2f"),
+                "Margin": st.column_config.NumberColumn(format="$%.2f"),
+            },
+        )
+
+    # Customers and sales per RFM bucket
+    st.markdown("## RFM Buckets")
+    with stage("aggregate.rfm") as s:
+        rfm = (
+            selected_customers.groupby("Bucket", observed=False)
+            .agg(
+                Customers=("Customer Name", "size"),
+                **{"Total Sales": ("Total Sales", "sum")},
+            )
+            .reset_index()
+        )
+        s["rows_out"] = len(rfm)
+    col_rfm1, col_rfm2 = st.columns(2)
+    with stage("render.rfm"):
+        col_rfm1.plotly_chart(
+            px.bar(rfm, x="Bucket", y="Customers", title="Customers per Bucket")
+        )
+        col_rfm2.plotly_chart(
+            px.bar(rfm, x="Bucket", y="Total Sales", title="Lifetime Sales per Bucket")
+        )
+
+    # Monthly acquisition cohorts
+    st.markdown("## Retention by Monthly Cohort")
+    with stage("aggregate.cohorts") as s:
+        cohorts = customers.cohort_retention(customer_filters, buckets)
+        s["rows_out"] = len(cohorts)
+    heatmap = (
+        alt.Chart(cohorts)
+        .mark_rect()
+        .encode(
+            x=alt.X("Months Since First:O", title="Months Since First Order"),
+            y=alt.Y("yearmonth(Cohort):O", title="Cohort"),
+            color=alt.Color("Retention %:Q", scale=alt.Scale(scheme="blues")),
+            tooltip=[
+                alt.Tooltip("yearmonth(Cohort):T", title="Cohort"),
+                "Months Since First",
+                "Customers",
+                alt.Tooltip("Retention %:Q", format=".1f"),
+            ],
+        )
+        .properties(width="container", height=400)
+    )
+    with stage("render.cohorts"):
+        st.altair_chart(heatmap, use_container_width=True)
+
+# The customer filters pick customers by their first and latest orders rather
+# than picking orders, so the export holds every order
+render_export_panel(engine.make_filters(), "top_customers")
+render_debug_panel()
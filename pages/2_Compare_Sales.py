@@ -1,22 +1,12 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
 from datetime import date
 
-st.set_page_config(page_title="Compare States", page_icon="🔀", layout="wide")
-
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    # Convert Date column to datetime
-    df["Date"] = pd.to_datetime(df["Date"])
-    # Convert Margin % to numeric
-    df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
-    return df
+import streamlit as st
 
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
 
-df = load_data("dummy_sales_data.csv")
+st.set_page_config(page_title="Compare States", page_icon="🔀", layout="wide")
+start_rerun("compare_sales")
 
 st.markdown(
     """
@@ -27,34 +17,40 @@ Use the filters on the left to narrow down your view. Then select two states bel
 
 st.sidebar.header("Filters")
 
+total_rows = attach_data()
+
+# Imported once the shell above is on screen
+import altair as alt
+
+import engine
+import filter_state
+import jobs
+from export import render_export_panel
+
+# Filters are shared with the other pages
+filter_state.init()
+
 # Date Range Filter
-min_date = df["Date"].min()
-max_date = df["Date"].max()
-start_date, end_date = st.sidebar.slider(
-    "Select Date Range:",
-    min_value=min_date.to_pydatetime().date(),
-    max_value=max_date.to_pydatetime().date(),
-    value=(min_date.to_pydatetime().date(), max_date.to_pydatetime().date()),
-    format="YYYY-MM-DD",
-)
-filtered_df = df[
-    (df["Date"] >= pd.to_datetime(start_date))
-    & (df["Date"] <= pd.to_datetime(end_date))
-]
+start_date, end_date = filter_state.date_range()
 
 # Category Filter
-categories = sorted(list(df["Product Category"].unique()))
-selected_categories = st.sidebar.multiselect(
-    "Choose Product Categories", categories, default=categories
+selected_categories = filter_state.multiselect(
+    "Product Category", "Choose Product Categories"
 )
-filtered_df = filtered_df[filtered_df["Product Category"].isin(selected_categories)]
 
 # Segment Filter
-segments = sorted(list(df["Customer Segment"].unique()))
-selected_segments = st.sidebar.multiselect(
-    "Choose Customer Segments", segments, default=segments
+selected_segments = filter_state.multiselect(
+    "Customer Segment", "Choose Customer Segments"
 )
-filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments)]
+
+# Period-over-period deltas on the KPI cards
+comparison = filter_state.comparison()
+
+filters = engine.make_filters(
+    start_date, end_date, categories=selected_categories, segments=selected_segments
+)
+with stage("filter", total_rows) as s:
+    s["rows_out"] = engine.row_count(filters)
 
 # st.write(f"**Date Range:** {start_date} to {end_date}")
 # st.write(
@@ -64,9 +60,73 @@ filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments
 #     f"**Customer Segments:** {', '.join(selected_segments) if selected_segments else 'None'}"
 # )
 
+
+def metric_card(title, value, changes, key):
+    delta = ""
+    if comparison != "None":
+        change = filter_state.format_change(changes, key, comparison)
+        delta = f"<div class='metric-title'>{change}</div>"
+    st.markdown(
+        f"<div class='metrics-container'><div class='metric-title'>{title}</div>"
+        f"<div class='metric-value'>{value}</div>{delta}</div>",
+        unsafe_allow_html=True,
+    )
+
+
+def render_metrics(metrics, changes):
+    metric_card(
+        "Total Sales", f"${metrics['total_sales']:,.2f}", changes, "total_sales"
+    )
+    metric_card(
+        "Total Margin", f"${metrics['total_margin']:,.2f}", changes, "total_margin"
+    )
+    metric_card(
+        "Avg Margin %", f"{metrics['avg_margin_pct']:,.2f}%", changes, "avg_margin_pct"
+    )
+
+
+def sales_over_time_chart(data, state, color):
+    return (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x="Date:T",
+            y="Total Sales:Q",
+            tooltip=["Date", alt.Tooltip("Total Sales:Q", format="$.2f")],
+            color=alt.value(color),
+        )
+        .properties(
+            title=f"{state}: Sales Over Time",
+            width="container",
+            height=300,
+        )
+    )
+
+
+def sales_by_category_chart(data, state, color):
+    return (
+        alt.Chart(data)
+        .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5)
+        .encode(
+            x=alt.X("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
+            y=alt.Y("Product Category:N", sort="-x"),
+            tooltip=[
+                alt.Tooltip("Product Category:N"),
+                alt.Tooltip("Total Sales:Q", format="$,.2f"),
+            ],
+            color=alt.value(color),
+        )
+        .properties(
+            title=f"{state}: Sales by Product Category",
+            width="container",
+            height=300,
+        )
+    )
+
+
 st.markdown("---")
 
-states_available = sorted(filtered_df["State"].unique().tolist())
+states_available = engine.sales_by("State", filters)["State"].tolist()
 col_select1, col_select2 = st.columns(2)
 with col_select1:
     selected_state_1 = st.selectbox(
@@ -77,22 +137,50 @@ with col_select2:
         "Choose the Second State:", ["(None)"] + states_available
     )
 
+# Once two states are picked, only their rows are exported
+export_filters = filters
 if selected_state_1 != "(None)" and selected_state_2 != "(None)":
-    state1_df = filtered_df[filtered_df["State"] == selected_state_1]
-    state2_df = filtered_df[filtered_df["State"] == selected_state_2]
+    export_filters = engine.make_filters(
+        start_date,
+        end_date,
+        categories=selected_categories,
+        segments=selected_segments,
+        states=[selected_state_1, selected_state_2],
+    )
+    state1_filters = engine.make_filters(
+        start_date,
+        end_date,
+        categories=selected_categories,
+        segments=selected_segments,
+        states=[selected_state_1],
+    )
+    state2_filters = engine.make_filters(
+        start_date,
+        end_date,
+        categories=selected_categories,
+        segments=selected_segments,
+        states=[selected_state_2],
+    )
+    with stage("filter.state", total_rows) as s:
+        state1_rows = engine.row_count(state1_filters)
+        state2_rows = engine.row_count(state2_filters)
+        s["rows_out"] = state1_rows + state2_rows
 
     # Ensure there is data for both states
-    if state1_df.empty or state2_df.empty:
+    if not state1_rows or not state2_rows:
         st.write("No data available for one or both of the selected states.")
     else:
-        # Compute metrics for both states
-        total_sales_1 = state1_df["Total Sales"].sum()
-        total_margin_1 = state1_df["Margin"].sum()
-        avg_margin_pct_1 = state1_df["Margin %"].mean() if not state1_df.empty else 0
-
-        total_sales_2 = state2_df["Total Sales"].sum()
-        total_margin_2 = state2_df["Margin"].sum()
-        avg_margin_pct_2 = state2_df["Margin %"].mean() if not state2_df.empty else 0
+        states = [
+            (selected_state_1, state1_filters, "steelblue"),
+            (selected_state_2, state2_filters, "orange"),
+        ]
+        previous = [None, None]
+        if comparison != "None":
+            with stage("aggregate.comparison"):
+                previous = [
+                    engine.previous_kpis(state_filters, comparison)
+                    for _, state_filters, _ in states
+                ]
 
         # Display metrics side by side
         st.markdown(
@@ -118,152 +206,67 @@ if selected_state_1 != "(None)" and selected_state_2 != "(None)":
             unsafe_allow_html=True,
         )
 
+        status_slot = st.empty()
+
         st.markdown("## Key Metrics Comparison")
 
         colA, colB = st.columns(2)
-        with colA:
-            st.markdown(f"### {selected_state_1}")
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Total Sales</div><div class='metric-value'>${:,.2f}</div></div>".format(
-                    total_sales_1
-                ),
-                unsafe_allow_html=True,
-            )
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Total Margin</div><div class='metric-value'>${:,.2f}</div></div>".format(
-                    total_margin_1
-                ),
-                unsafe_allow_html=True,
-            )
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Avg Margin %</div><div class='metric-value'>{:,.2f}%</div></div>".format(
-                    avg_margin_pct_1
-                ),
-                unsafe_allow_html=True,
-            )
-
-        with colB:
-            st.markdown(f"### {selected_state_2}")
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Total Sales</div><div class='metric-value'>${:,.2f}</div></div>".format(
-                    total_sales_2
-                ),
-                unsafe_allow_html=True,
-            )
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Total Margin</div><div class='metric-value'>${:,.2f}</div></div>".format(
-                    total_margin_2
-                ),
-                unsafe_allow_html=True,
-            )
-            st.markdown(
-                "<div class='metrics-container'><div class='metric-title'>Avg Margin %</div><div class='metric-value'>{:,.2f}%</div></div>".format(
-                    avg_margin_pct_2
-                ),
-                unsafe_allow_html=True,
-            )
+        colA.markdown(f"### {selected_state_1}")
+        colB.markdown(f"### {selected_state_2}")
+        metric_slots = [colA.empty(), colB.empty()]
 
         st.markdown("---")
 
         st.markdown("## Sales Over Time Comparison")
 
-        # Sales Over Time for both states
-        sales_time_state1 = state1_df.groupby("Date", as_index=False)[
-            "Total Sales"
-        ].sum()
-        sales_time_state2 = state2_df.groupby("Date", as_index=False)[
-            "Total Sales"
-        ].sum()
-
-        line_chart1 = (
-            alt.Chart(sales_time_state1)
-            .mark_line(point=True)
-            .encode(
-                x="Date:T",
-                y="Total Sales:Q",
-                tooltip=["Date", alt.Tooltip("Total Sales:Q", format="$.2f")],
-                color=alt.value("steelblue"),
-            )
-            .properties(
-                title=f"{selected_state_1}: Sales Over Time",
-                width="container",
-                height=300,
-            )
-        )
-
-        line_chart2 = (
-            alt.Chart(sales_time_state2)
-            .mark_line(point=True)
-            .encode(
-                x="Date:T",
-                y="Total Sales:Q",
-                tooltip=["Date", alt.Tooltip("Total Sales:Q", format="$.2f")],
-                color=alt.value("orange"),
-            )
-            .properties(
-                title=f"{selected_state_2}: Sales Over Time",
-                width="container",
-                height=300,
-            )
-        )
-
         colC, colD = st.columns(2)
-        colC.altair_chart(line_chart1, use_container_width=True)
-        colD.altair_chart(line_chart2, use_container_width=True)
+        sales_time_slots = [colC.empty(), colD.empty()]
 
         st.markdown("---")
 
         st.markdown("## Product Category Breakdown Comparison")
 
-        # Product Category Breakdown
-        cat_state1 = state1_df.groupby("Product Category", as_index=False)[
-            "Total Sales"
-        ].sum()
-        cat_state2 = state2_df.groupby("Product Category", as_index=False)[
-            "Total Sales"
-        ].sum()
-
-        bar_chart_cat1 = (
-            alt.Chart(cat_state1)
-            .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5)
-            .encode(
-                x=alt.X("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
-                y=alt.Y("Product Category:N", sort="-x"),
-                tooltip=[
-                    alt.Tooltip("Product Category:N"),
-                    alt.Tooltip("Total Sales:Q", format="$,.2f"),
-                ],
-                color=alt.value("steelblue"),
-            )
-            .properties(
-                title=f"{selected_state_1}: Sales by Product Category",
-                width="container",
-                height=300,
-            )
-        )
-
-        bar_chart_cat2 = (
-            alt.Chart(cat_state2)
-            .mark_bar(cornerRadiusTopLeft=5, cornerRadiusTopRight=5)
-            .encode(
-                x=alt.X("Total Sales:Q", axis=alt.Axis(format="$,.2f")),
-                y=alt.Y("Product Category:N", sort="-x"),
-                tooltip=[
-                    alt.Tooltip("Product Category:N"),
-                    alt.Tooltip("Total Sales:Q", format="$,.2f"),
-                ],
-                color=alt.value("orange"),
-            )
-            .properties(
-                title=f"{selected_state_2}: Sales by Product Category",
-                width="container",
-                height=300,
-            )
-        )
-
         colE, colF = st.columns(2)
-        colE.altair_chart(bar_chart_cat1, use_container_width=True)
-        colF.altair_chart(bar_chart_cat2, use_container_width=True)
+        category_slots = [colE.empty(), colF.empty()]
+
+        # The aggregations for both states run on the shared job pool, and each
+        # block is drawn as soon as its result is in. Leaving the block, as
+        # happens when a newer rerun interrupts this one, drops the jobs no
+        # other session is waiting for.
+        with jobs.Batch() as batch:
+            pending = {}
+            for i, (_, state_filters, _) in enumerate(states):
+                pending[("metrics", i)] = batch.submit(engine.kpis, state_filters)
+            for i, (_, state_filters, _) in enumerate(states):
+                pending[("sales_over_time", i)] = batch.submit(
+                    engine.sales_over_time, state_filters
+                )
+            for i, (_, state_filters, _) in enumerate(states):
+                pending[("sales_by_category", i)] = batch.submit(
+                    engine.sales_by, "Product Category", state_filters
+                )
+
+            for (name, i), result in batch.as_completed(pending, status_slot):
+                state, _, color = states[i]
+                with stage(f"render.{name}"):
+                    if name == "metrics":
+                        with metric_slots[i].container():
+                            render_metrics(
+                                result, engine.kpi_changes(result, previous[i])
+                            )
+                    elif name == "sales_over_time":
+                        sales_time_slots[i].altair_chart(
+                            sales_over_time_chart(result, state, color),
+                            use_container_width=True,
+                        )
+                    else:
+                        category_slots[i].altair_chart(
+                            sales_by_category_chart(result, state, color),
+                            use_container_width=True,
+                        )
 
 else:
     st.write("Select two different states above to start the comparison.")
+
+render_export_panel(export_filters, "compare_sales")
+render_debug_panel()
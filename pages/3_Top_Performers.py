@@ -1,22 +1,12 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
 from datetime import date
 
-st.set_page_config(page_title="Top Performers", page_icon="⭐", layout="wide")
-
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    # Convert Date column to datetime
-    df["Date"] = pd.to_datetime(df["Date"])
-    # Convert Margin % to numeric
-    df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
-    return df
+import streamlit as st
 
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
 
-df = load_data("dummy_sales_data.csv")
+st.set_page_config(page_title="Top Performers", page_icon="⭐", layout="wide")
+start_rerun("top_performers")
 
 st.markdown(
     """
@@ -27,34 +17,37 @@ Use this page to quickly identify the top 5 products and top 5 segments, based o
 
 st.sidebar.header("Filters")
 
+total_rows = attach_data()
+
+# Imported once the shell above is on screen
+import altair as alt
+
+import engine
+import filter_state
+from export import render_export_panel
+
+# Filters are shared with the other pages
+filter_state.init()
+
 # Date Range Filter
-min_date = df["Date"].min()
-max_date = df["Date"].max()
-start_date, end_date = st.sidebar.slider(
-    "Select Date Range:",
-    min_value=min_date.to_pydatetime().date(),
-    max_value=max_date.to_pydatetime().date(),
-    value=(min_date.to_pydatetime().date(), max_date.to_pydatetime().date()),
-    format="YYYY-MM-DD",
-)
-filtered_df = df[
-    (df["Date"] >= pd.to_datetime(start_date))
-    & (df["Date"] <= pd.to_datetime(end_date))
-]
+start_date, end_date = filter_state.date_range()
 
 # Category Filter
-categories = sorted(list(df["Product Category"].unique()))
-selected_categories = st.sidebar.multiselect(
-    "Choose Product Categories", categories, default=categories
+selected_categories = filter_state.multiselect(
+    "Product Category", "Choose Product Categories"
 )
-filtered_df = filtered_df[filtered_df["Product Category"].isin(selected_categories)]
 
 # Segment Filter
-segments = sorted(list(df["Customer Segment"].unique()))
-selected_segments = st.sidebar.multiselect(
-    "Choose Customer Segments", segments, default=segments
+selected_segments = filter_state.multiselect(
+    "Customer Segment", "Choose Customer Segments"
+)
+
+filters = engine.make_filters(
+    start_date, end_date, categories=selected_categories, segments=selected_segments
 )
-filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments)]
+with stage("filter", total_rows) as s:
+    filtered_rows = engine.row_count(filters)
+    s["rows_out"] = filtered_rows
 
 st.write(f"**Date Range:** {start_date} to {end_date}")
 st.write(
@@ -66,25 +59,19 @@ st.write(
 
 st.markdown("---")
 
-if filtered_df.empty:
+if not filtered_rows:
     st.write("No data available with the selected filters.")
 else:
     # Top 5 Products by Total Sales
     # Group by Product Sub-Category to identify top products
-    top_products = (
-        filtered_df.groupby("Product Sub-Category", as_index=False)
-        .agg({"Total Sales": "sum"})
-        .sort_values("Total Sales", ascending=False)
-        .head(5)
-    )
+    with stage("aggregate.top_products", filtered_rows) as s:
+        top_products = engine.top_n("Product Sub-Category", filters, 5)
+        s["rows_out"] = len(top_products)
 
     # Top 5 Segments by Total Sales
-    top_segments = (
-        filtered_df.groupby("Customer Segment", as_index=False)
-        .agg({"Total Sales": "sum"})
-        .sort_values("Total Sales", ascending=False)
-        .head(5)
-    )
+    with stage("aggregate.top_segments", filtered_rows) as s:
+        top_segments = engine.top_n("Customer Segment", filters, 5)
+        s["rows_out"] = len(top_segments)
 
     col1, col2 = st.columns(2)
 
@@ -103,7 +90,8 @@ else:
             )
             .properties(width="container", height=300)
         )
-        st.altair_chart(product_chart, use_container_width=True)
+        with stage("render.top_products"):
+            st.altair_chart(product_chart, use_container_width=True)
 
     with col2:
         st.markdown("### Top 5 Segments by Total Sales")
@@ -120,10 +108,14 @@ else:
             )
             .properties(width="container", height=300)
         )
-        st.altair_chart(segment_chart, use_container_width=True)
+        with stage("render.top_segments"):
+            st.altair_chart(segment_chart, use_container_width=True)
 
 st.markdown("---")
 
 st.write(
     "Use the filters to adjust the dataset and see which products and segments rise to the top under different conditions."
 )
+
+render_export_panel(filters, "top_performers")
+render_debug_panel()
@@ -1,24 +1,15 @@
-import streamlit as st
-import pandas as pd
-import altair as alt
+from concurrent import futures
 from datetime import date
 
+import streamlit as st
+
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
+
 st.set_page_config(
     page_title="Sales Over Time by Category", page_icon="📈", layout="wide"
 )
-
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    # Convert Date column to datetime
-    df["Date"] = pd.to_datetime(df["Date"])
-    # Convert Margin % to numeric
-    df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
-    return df
-
-
-df = load_data("dummy_sales_data.csv")
+start_rerun("sales_by_category")
 
 st.markdown(
     """
@@ -28,42 +19,43 @@ st.markdown(
 
 st.sidebar.header("Filters")
 
+total_rows = attach_data()
+
+# Imported once the shell above is on screen
+import altair as alt
+import numpy as np
+
+import engine
+import filter_state
+import jobs
+import sampling
+import trends
+from export import render_export_panel
+
+# Filters are shared with the other pages
+filter_state.init()
+
 # Date Range Filter
-min_date = df["Date"].min()
-max_date = df["Date"].max()
-start_date, end_date = st.sidebar.slider(
-    "Select Date Range:",
-    min_value=min_date.to_pydatetime().date(),
-    max_value=max_date.to_pydatetime().date(),
-    value=(min_date.to_pydatetime().date(), max_date.to_pydatetime().date()),
-    format="YYYY-MM-DD",
-)
-filtered_df = df[
-    (df["Date"] >= pd.to_datetime(start_date))
-    & (df["Date"] <= pd.to_datetime(end_date))
-]
+start_date, end_date = filter_state.date_range()
 
 # Segment Filter
-segments = sorted(list(df["Customer Segment"].unique()))
-selected_segments = st.sidebar.multiselect(
-    "Choose Customer Segments", segments, default=segments
+selected_segments = filter_state.multiselect(
+    "Customer Segment", "Choose Customer Segments"
 )
-filtered_df = filtered_df[filtered_df["Customer Segment"].isin(selected_segments)]
 
-# State Filter with "All" option
-states = sorted(list(df["State"].unique()))
-all_option = ["All"]  # Special option to select all states
-state_options = all_option + states
+# State Filter; "All" selects every state
+selected_states = filter_state.multiselect("State", "Choose States")
 
-selected_states = st.sidebar.multiselect(
-    "Choose States", state_options, default=["All"]
+filters = engine.make_filters(
+    start_date, end_date, segments=selected_segments, states=selected_states
 )
 
-# If "All" is selected, use all states
-if "All" in selected_states:
-    selected_states = states
+# Fast preview answers from a stratified sample first and swaps in the exact
+# numbers once they have been computed in the background
+fast_preview = filter_state.fast_preview()
 
-filtered_df = filtered_df[filtered_df["State"].isin(selected_states)]
+# Overlay the same window a month or a year earlier as dashed lines
+comparison = filter_state.comparison()
 
 # st.write(f"**Date Range:** {start_date} to {end_date}")
 # st.write(
@@ -81,31 +73,23 @@ view_type = st.radio(
 # Frequency selection: Daily, Monthly, Quarterly
 freq = st.radio("Select Frequency:", ["Daily", "Monthly", "Quarterly"], index=0)
 
-if filtered_df.empty:
-    st.write("No data available with the selected filters.")
-else:
-    # Depending on the frequency selected, we transform the dates
-    freq_df = filtered_df.copy()
-
-    if freq == "Daily":
-        # Keep data as is, just group by day
-        freq_df["Period"] = freq_df["Date"]
-    elif freq == "Monthly":
-        # Convert to monthly period
-        freq_df["Period"] = freq_df["Date"].dt.to_period("M").dt.to_timestamp()
-    else:  # Quarterly
-        freq_df["Period"] = freq_df["Date"].dt.to_period("Q").dt.to_timestamp()
-
-    # Group data by Category and Period
-    grouped = (
-        freq_df.groupby(["Product Category", "Period"], as_index=False)["Total Sales"]
-        .sum()
-        .sort_values("Period")
-    )
+status_slot = st.empty()
+chart_slot = st.empty()
+
+
+def render_chart(grouped, previous=None):
+    # grouped carries an "Error" column when it is a sample estimate; previous
+    # is the comparison window moved onto the same dates
+    if grouped.empty:
+        chart_slot.write("No data available with the selected filters.")
+        return
+    grouped = grouped.copy()
 
     if view_type == "Cumulative":
         # Calculate cumulative sales per category
-        grouped["Value"] = grouped.groupby("Product Category")["Total Sales"].cumsum()
+        grouped["Value"] = grouped.groupby("Product Category", observed=True)[
+            "Total Sales"
+        ].cumsum()
         y_axis_title = "Cumulative Sales"
         chart_title = f"Cumulative Sales Over Time by Category ({freq})"
         tooltip_value = "Value"
@@ -116,6 +100,15 @@ else:
         chart_title = f"{freq} Sales Over Time by Category"
         tooltip_value = "Value"
 
+    if previous is not None:
+        previous = previous.copy()
+        if view_type == "Cumulative":
+            previous["Value"] = previous.groupby("Product Category", observed=True)[
+                "Total Sales"
+            ].cumsum()
+        else:
+            previous["Value"] = previous["Total Sales"]
+
     # Create line chart with all categories
     line_chart = (
         alt.Chart(grouped)
@@ -130,13 +123,119 @@ else:
                 alt.Tooltip(tooltip_value, format="$.2f"),
             ],
         )
-        .properties(title=chart_title, width="container", height=400)
     )
 
-    st.altair_chart(line_chart, use_container_width=True)
+    if "Error" in grouped:
+        # Treat periods as independent, so cumulative errors add in quadrature
+        if view_type == "Cumulative":
+            grouped["Error"] = np.sqrt(
+                (grouped["Error"] ** 2)
+                .groupby(grouped["Product Category"], observed=True)
+                .cumsum()
+            )
+        band = (
+            alt.Chart(
+                grouped.assign(
+                    Low=grouped["Value"] - grouped["Error"],
+                    High=grouped["Value"] + grouped["Error"],
+                )
+            )
+            .mark_area(opacity=0.2)
+            .encode(x="Period:T", y="Low:Q", y2="High:Q", color="Product Category:N")
+        )
+        line_chart = alt.layer(band, line_chart)
+    elif freq == "Daily" and view_type != "Cumulative":
+        # Mark days where a category broke from its rolling trend
+        flagged = trends.flag_series(grouped, ["Product Category"], "Period")
+        anomaly_points = (
+            alt.Chart(flagged[flagged["Anomaly"]])
+            .mark_point(size=90, filled=True, shape="diamond")
+            .encode(
+                x="Period:T",
+                y="Total Sales:Q",
+                color="Product Category:N",
+                tooltip=[
+                    alt.Tooltip("Period:T"),
+                    alt.Tooltip("Product Category:N"),
+                    alt.Tooltip("Total Sales:Q", format="$.2f"),
+                    alt.Tooltip("Z-Score:Q", format=".2f"),
+                    alt.Tooltip("WoW %:Q", format=".1f"),
+                ],
+            )
+        )
+        line_chart = alt.layer(line_chart, anomaly_points)
+
+    if previous is not None and not previous.empty:
+        previous_lines = (
+            alt.Chart(previous)
+            .mark_line(strokeDash=[6, 4], opacity=0.6)
+            .encode(
+                x="Period:T",
+                y="Value:Q",
+                color="Product Category:N",
+                tooltip=[
+                    alt.Tooltip("Period:T"),
+                    alt.Tooltip("Product Category:N"),
+                    alt.Tooltip("Value:Q", title=comparison, format="$.2f"),
+                ],
+            )
+        )
+        line_chart = alt.layer(previous_lines, line_chart)
+
+    with stage("render.sales_by_period"):
+        chart_slot.altair_chart(
+            line_chart.properties(title=chart_title, width="container", height=400),
+            use_container_width=True,
+        )
+
+
+previous = None
+if comparison != "None":
+    with stage("aggregate.comparison") as s:
+        previous = engine.previous_sales_by_period(
+            "Product Category", filters, comparison, engine.FREQUENCIES[freq]
+        )
+        s["rows_out"] = len(previous)
+
+# The aggregation runs on the shared job pool; leaving the block, as happens
+# when a newer rerun interrupts this one, drops it unless another session is
+# waiting for the same query
+with jobs.Batch() as batch:
+    pending = {
+        "sales_by_period": batch.submit(
+            engine.sales_by_period,
+            "Product Category",
+            filters,
+            engine.FREQUENCIES[freq],
+        )
+    }
+    status = "Computing results"
+    if fast_preview:
+        # If the exact answer isn't ready almost immediately, draw the estimate
+        # first and swap in the exact one once it arrives
+        futures.wait(pending.values(), timeout=sampling.PREVIEW_WAIT_S)
+        if not pending["sales_by_period"].done():
+            with stage("aggregate.preview") as s:
+                grouped = sampling.sales_by_period_estimate(
+                    "Product Category", filters, engine.FREQUENCIES[freq]
+                )
+                s["rows_out"] = len(grouped)
+            render_chart(grouped, previous)
+            status = (
+                f"⚡ Preview from a {sampling.SAMPLE_FRACTION:.0%} stratified "
+                "sample with 95% error bands. Computing exact results"
+            )
+    for _, grouped in batch.as_completed(pending, status_slot, status):
+        render_chart(grouped, previous)
 
 st.markdown("---")
 
 st.write(
     "Use the filters in the sidebar to adjust the data. Use the toggles above to switch between daily, monthly, or quarterly views, and between trend or cumulative displays."
 )
+
+with stage("aggregate.anomalies") as s:
+    s["rows_out"] = len(trends.render_anomaly_table(filters))
+
+render_export_panel(filters, "sales_by_category")
+render_debug_panel()
@@ -1,21 +1,10 @@
-import pandas as pd
-import plotly.express as px
 import streamlit as st
 
-st.set_page_config(page_title="Sales by State", page_icon="🗺️", layout="wide")
-
-
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    df["Date"] = pd.to_datetime(df["Date"])
-    if "Margin %" in df.columns and df["Margin %"].dtype == object:
-        df["Margin %"] = df["Margin %"].str.replace("%", "").astype(float)
-    return df
+from instrumentation import render_debug_panel, stage, start_rerun
+from page_shell import attach_data
 
-
-# Load your data
-df = load_data("dummy_sales_data.csv")
+st.set_page_config(page_title="Sales by State", page_icon="🗺️", layout="wide")
+start_rerun("map")
 
 st.markdown(
     """
@@ -27,33 +16,37 @@ Use the filters on the left to adjust the data displayed.
 
 st.sidebar.header("Filters")
 
+total_rows = attach_data()
+
+# Imported once the shell above is on screen
+import plotly.express as px
+
+import engine
+import filter_state
+from export import render_export_panel
+
+# Filters are shared with the other pages
+filter_state.init()
+
 # Date Range Filter
-min_date = df["Date"].min()
-max_date = df["Date"].max()
-start_date, end_date = st.sidebar.slider(
-    "Select Date Range:",
-    min_value=min_date.to_pydatetime().date(),
-    max_value=max_date.to_pydatetime().date(),
-    value=(min_date.to_pydatetime().date(), max_date.to_pydatetime().date()),
-)
+start_date, end_date = filter_state.date_range()
 
 # filter data based on product category
-categories = sorted(list(df["Product Category"].unique()))
-selected_categories = st.sidebar.multiselect(
-    "Choose Product Categories", categories, default=categories
+selected_categories = filter_state.multiselect(
+    "Product Category", "Choose Product Categories"
 )
-filtered_df_1 = df[df["Product Category"].isin(selected_categories)]
-
 
-# Filter data based on date range
-filtered_df = filtered_df_1[
-    (df["Date"] >= pd.to_datetime(start_date))
-    & (df["Date"] <= pd.to_datetime(end_date))
-]
+# Filter data based on date range and category
+filters = engine.make_filters(start_date, end_date, categories=selected_categories)
+with stage("filter", total_rows) as s:
+    filtered_rows = engine.row_count(filters)
+    s["rows_out"] = filtered_rows
 
 
 # Aggregate sales by state
-state_sales = filtered_df.groupby("State")["Total Sales"].sum().reset_index()
+with stage("aggregate.sales_by_state", filtered_rows) as s:
+    state_sales = engine.sales_by("State", filters)
+    s["rows_out"] = len(state_sales)
 
 # Create choropleth map
 fig = px.choropleth(
@@ -68,4 +61,8 @@ fig = px.choropleth(
 )
 
 # Show the map
-st.plotly_chart(fig)
+with stage("render.map"):
+    st.plotly_chart(fig)
+
+render_export_panel(filters, "map")
+render_debug_panel()
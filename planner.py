@@ -0,0 +1,339 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+# Page aggregates all have one shape: the rows matching a Filters, totalled, or
+# summed by date, by one dimension, or by a dimension and period. The planner
+# answers each from the cheapest source that can serve it:
+#   prefix  running daily totals per State x Category x Segment, so any date
+#           range costs two lookups per combination
+#   cube    the daily cube from engine.daily_cube(), filtered and grouped
+#   bitmap  the raw rows, narrowed with per-value bitmaps before the date test
+#   scan    the raw rows, with every predicate tested on every row
+# Costs are rough counts of values touched. Only the raw rows carry columns
+# outside the cube, such as Product Sub-Category.
+SOURCES = ["prefix", "cube", "bitmap", "scan"]
+# DASHBOARD_PLANNER_SOURCES limits the planner to some sources, e.g. "scan" to
+# measure what the pre-aggregates save. The scan is the fallback regardless.
+ENABLED_SOURCES = os.environ.get("DASHBOARD_PLANNER_SOURCES", ",".join(SOURCES))
+ENABLED_SOURCES = [s.strip() for s in ENABLED_SOURCES.split(",") if s.strip()]
+# Prefix sums hold days x combinations cells per measure; above this the
+# source is skipped rather than built
+PREFIX_MAX_CELLS = int(os.environ.get("DASHBOARD_PREFIX_MAX_CELLS", "2000000"))
+# Each planned query is kept in a ring buffer and, when
+# DASHBOARD_INSTRUMENTATION_DIR is set, appended to plans.jsonl there
+LOG_SIZE = 1000
+LOG_DIR_ENV = "DASHBOARD_INSTRUMENTATION_DIR"
+
+# Filters fields and the columns they test, in filter_mask() order
+FILTER_COLUMNS = {
+    "categories": "Product Category",
+    "segments": "Customer Segment",
+    "states": "State",
+}
+FILTER_FIELDS = {column: field for field, column in FILTER_COLUMNS.items()}
+CUBE_DIMENSIONS = [key for key in engine.CUBE_KEYS if key != "Date"]
+CUBE_MEASURES = ["Total Sales", "Margin", "Margin % Sum", "Orders"]
+
+_log = deque(maxlen=LOG_SIZE)
+_totals = {}
+_log_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Query:
+    # group_by is () for the KPI totals, ("Date",), (column,) or
+    # (column, "Period") with freq
+    group_by: tuple
+    filters: engine.Filters
+    freq: str = "D"
+
+
+def normalize(filters, file_path):
+    # Predicates every row passes are dropped, so "all categories" or the full
+    # date range costs nothing on any source
+    start, end = engine.date_bounds(file_path)
+    changes = {}
+    if filters.start_date is not None and filters.start_date <= pd.Timestamp(start):
+        changes["start_date"] = None
+    if filters.end_date is not None and filters.end_date >= pd.Timestamp(end):
+        changes["end_date"] = None
+    for field, column in FILTER_COLUMNS.items():
+        values = getattr(filters, field)
+        options = engine.dimension_values(column, file_path)
+        if values is not None and set(options) <= set(values):
+            changes[field] = None
+    return replace(filters, **changes)
+
+
+def _date_fraction(filters, file_path):
+    start, end = (pd.Timestamp(d) for d in engine.date_bounds(file_path))
+    low = max(start, filters.start_date or start)
+    high = min(end, filters.end_date or end)
+    return max((high - low).days + 1, 0) / ((end - start).days + 1)
+
+
+def _predicates(filters):
+    dates = sum(d is not None for d in (filters.start_date, filters.end_date))
+    return dates, [
+        (field, column)
+        for field, column in FILTER_COLUMNS.items()
+        if getattr(filters, field) is not None
+    ]
+
+
+def _selectivity(filters, file_path):
+    # Share of rows expected to match, assuming independent dimensions
+    fraction = _date_fraction(filters, file_path)
+    for field, column in _predicates(filters)[1]:
+        values = engine.dimension_values(column, file_path)
+        fraction *= len(set(getattr(filters, field)) & set(values)) / len(values)
+    return fraction
+
+
+def plan(query, file_path=engine.DATA_FILE):
+    # The source to run the query on and the estimated cost of every source
+    # that could
+    filters = normalize(query.filters, file_path)
+    dates, dimensions = _predicates(filters)
+    tests = dates + len(dimensions)
+    selectivity = _selectivity(filters, file_path)
+    columns = set(query.group_by) - {"Date", "Period"}
+    costs = {}
+
+    # Prefix sums have no days left to group by
+    if (
+        "prefix" in ENABLED_SOURCES
+        and len(query.group_by) <= 1
+        and set(query.group_by) <= set(CUBE_DIMENSIONS)
+    ):
+        prefix = prefix_sums(file_path)
+        if prefix is not None:
+            combinations = int(np.prod(prefix["shape"]))
+            costs["prefix"] = 2 * combinations * len(CUBE_MEASURES)
+    if "cube" in ENABLED_SOURCES and columns <= set(CUBE_DIMENSIONS):
+        cube_rows = len(engine.daily_cube(file_path))
+        costs["cube"] = cube_rows * (tests + 1) + cube_rows * selectivity
+    rows = engine.dataset_rows(file_path)
+    if (
+        "bitmap" in ENABLED_SOURCES
+        and dimensions
+        and not engine.is_partitioned(file_path)
+    ):
+        # Bitmaps are one bit per row; unpacking the result touches every row
+        # once, and only the candidates are tested on date
+        selected = sum(len(getattr(filters, field)) for field, _ in dimensions)
+        candidates = rows * _selectivity(
+            replace(filters, start_date=None, end_date=None), file_path
+        )
+        costs["bitmap"] = (
+            rows / 8 * selected + rows + candidates * dates + rows * selectivity
+        )
+    if "scan" in ENABLED_SOURCES or not costs:
+        # Partitioned data only reads the months the date range overlaps
+        window = rows
+        if engine.is_partitioned(file_path):
+            window = rows * _date_fraction(filters, file_path)
+        costs["scan"] = window * (tests + 1) + rows * selectivity
+    return min(costs, key=costs.get), costs, filters
+
+
+def execute(query, file_path=engine.DATA_FILE):
+    source, costs, filters = plan(query, file_path)
+    started = time.perf_counter()
+    if source == "prefix":
+        result = _from_prefix(query, filters, file_path)
+    elif source == "cube":
+        result = _aggregate(query, engine.cube_rows(filters, file_path), cube=True)
+    elif source == "bitmap":
+        result = _aggregate(query, _bitmap_rows(filters, file_path))
+    else:
+        # The page's own Filters, so the filtered index is shared with the
+        # other consumers of engine.filter_data()
+        result = _aggregate(query, engine.filter_data(query.filters, file_path))
+    _record(query, filters, source, costs, time.perf_counter() - started, result)
+    return result
+
+
+def _kpis(total_sales, total_margin, margin_pct_sum, orders):
+    if not orders:
+        return {"total_sales": 0.0, "total_margin": 0.0, "avg_margin_pct": 0.0}
+    return {
+        "total_sales": float(total_sales),
+        "total_margin": float(total_margin),
+        "avg_margin_pct": float(margin_pct_sum / orders),
+    }
+
+
+def _aggregate(query, rows, cube=False):
+    # The same aggregations as on the raw rows; cube rows carry sums, so the
+    # average margin is rebuilt from the Margin % Sum and Orders columns
+    if not query.group_by:
+        if cube:
+            return _kpis(*(rows[measure].sum() for measure in CUBE_MEASURES))
+        return engine.compute_kpis(rows)
+    if query.group_by[-1] == "Period":
+        return engine.sum_sales_by_period(rows, query.group_by[0], query.freq)
+    return engine.sum_sales_by(rows, query.group_by[0])
+
+
+@engine.memoized(maxsize=4)
+def prefix_sums(file_path=engine.DATA_FILE):
+    # Running totals of each cube measure over days, one column per
+    # State x Category x Segment combination. Row i holds the totals of the
+    # days before days[i], so a range is the difference of two rows.
+    cube = engine.daily_cube(file_path)
+    days = pd.DatetimeIndex(np.unique(cube["Date"].to_numpy()))
+    dtypes = [cube[column].dtype for column in CUBE_DIMENSIONS]
+    shape = tuple(len(dtype.categories) for dtype in dtypes)
+    if (len(days) + 1) * int(np.prod(shape)) > PREFIX_MAX_CELLS:
+        return None
+
+    day = days.searchsorted(cube["Date"].to_numpy())
+    combination = np.ravel_multi_index(
+        [cube[column].cat.codes.to_numpy() for column in CUBE_DIMENSIONS], shape
+    )
+    sums = {}
+    for measure in CUBE_MEASURES:
+        values = cube[measure].to_numpy()
+        # A day and combination is one cube row, so no cell is written twice
+        grid = np.zeros((len(days) + 1, int(np.prod(shape))), dtype=values.dtype)
+        grid[day + 1, combination] = values
+        sums[measure] = np.cumsum(grid, axis=0)
+    return {"days": days, "dtypes": dtypes, "shape": shape, "sums": sums}
+
+
+def _from_prefix(query, filters, file_path):
+    prefix = prefix_sums(file_path)
+    days = prefix["days"]
+    low = 0
+    high = len(days)
+    if filters.start_date is not None:
+        low = days.searchsorted(filters.start_date, side="left")
+    if filters.end_date is not None:
+        high = max(days.searchsorted(filters.end_date, side="right"), low)
+
+    # Selected values of each dimension, combined into a mask over the
+    # combinations
+    mask = np.ones(prefix["shape"], dtype=bool)
+    for axis, (column, dtype) in enumerate(zip(CUBE_DIMENSIONS, prefix["dtypes"])):
+        values = getattr(filters, FILTER_FIELDS[column])
+        if values is not None:
+            selected = np.isin(dtype.categories, values)
+            shape = [1] * len(CUBE_DIMENSIONS)
+            shape[axis] = -1
+            mask &= selected.reshape(shape)
+
+    window = {
+        measure: np.where(mask, (sums[high] - sums[low]).reshape(prefix["shape"]), 0)
+        for measure, sums in prefix["sums"].items()
+    }
+    if not query.group_by:
+        return _kpis(*(window[measure].sum() for measure in CUBE_MEASURES))
+
+    column = query.group_by[0]
+    axis = CUBE_DIMENSIONS.index(column)
+    others = tuple(a for a in range(len(CUBE_DIMENSIONS)) if a != axis)
+    sales = window["Total Sales"].sum(axis=others)
+    # Values without orders in the window are left out, as a groupby would
+    codes = np.nonzero(window["Orders"].sum(axis=others))[0]
+    return pd.DataFrame(
+        {
+            column: pd.Categorical.from_codes(codes, dtype=prefix["dtypes"][axis]),
+            "Total Sales": sales[codes],
+        }
+    )
+
+
+@engine.memoized(maxsize=4)
+def bitmap_index(file_path=engine.DATA_FILE):
+    # One packed bitmap per value of each filtered column, over the rows of
+    # engine.load_data()
+    df = engine.load_data(file_path)
+    index = {}
+    for column in FILTER_COLUMNS.values():
+        codes = df[column].cat.codes.to_numpy()
+        index[column] = np.stack(
+            [
+                np.packbits(codes == code)
+                for code in range(len(df[column].cat.categories))
+            ]
+        )
+    return index
+
+
+def _bitmap_rows(filters, file_path):
+    df = engine.load_data(file_path)
+    index = bitmap_index(file_path)
+    bits = None
+    for field, column in _predicates(filters)[1]:
+        codes = df[column].cat.categories.get_indexer(getattr(filters, field))
+        codes = codes[codes >= 0]
+        if len(codes):
+            selected = np.bitwise_or.reduce(index[column][codes], axis=0)
+        else:
+            selected = np.zeros(index[column].shape[1], dtype=np.uint8)
+        bits = selected if bits is None else bits & selected
+    positions = np.unpackbits(bits, count=len(df)).nonzero()[0]
+
+    # Only the candidate rows are tested on date
+    dates = df["Date"].to_numpy()[positions]
+    keep = np.ones(len(positions), dtype=bool)
+    if filters.start_date is not None:
+        keep &= dates >= filters.start_date.to_datetime64()
+    if filters.end_date is not None:
+        keep &= dates <= filters.end_date.to_datetime64()
+    return df.iloc[positions[keep]]
+
+
+def _record(query, filters, source, costs, seconds, result):
+    entry = {
+        "at": time.time(),
+        "group_by": list(query.group_by),
+        "freq": query.freq,
+        "filters": {
+            field: str(value) if field.endswith("date") else list(value)
+            for field, value in vars(filters).items()
+            if value is not None
+        },
+        "source": source,
+        "costs": {name: round(cost) for name, cost in costs.items()},
+        "seconds": seconds,
+        "rows_out": len(result) if isinstance(result, pd.DataFrame) else 1,
+    }
+    with _log_lock:
+        _log.append(entry)
+        count, total = _totals.get(source, (0, 0.0))
+        _totals[source] = (count + 1, total + seconds)
+    out_dir = os.environ.get(LOG_DIR_ENV)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "plans.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def source_stats():
+    # Queries answered and time spent per source since the process started
+    with _log_lock:
+        totals = dict(_totals)
+    return {
+        source: {
+            "queries": count,
+            "seconds": seconds,
+            "avg_ms": seconds / count * 1000,
+        }
+        for source, (count, seconds) in totals.items()
+    }
+
+
+def recent_plans(n=20):
+    with _log_lock:
+        return list(_log)[-n:]
@@ -0,0 +1,183 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+# Fast preview answers from a stratified sample of the orders. Every
+# State x Product Category x Customer Segment stratum keeps at least
+# MIN_PER_STRATUM rows (or all of them) and SAMPLE_FRACTION of its rows
+# otherwise, so small strata are never missing from an estimate.
+STRATA = ["State", "Product Category", "Customer Segment"]
+SAMPLE_COLUMNS = [
+    "Date",
+    "State",
+    "Product Category",
+    "Customer Segment",
+    "Total Sales",
+    "Margin",
+    "Margin %",
+]
+SAMPLE_FRACTION = float(os.environ.get("DASHBOARD_SAMPLE_FRACTION", "0.01"))
+MIN_PER_STRATUM = int(os.environ.get("DASHBOARD_SAMPLE_MIN", "20"))
+# Two-sided 95% normal interval
+Z_95 = 1.96
+# How long a page waits for the exact answer before drawing the preview
+PREVIEW_WAIT_S = 0.05
+
+
+@dataclass(frozen=True, eq=False)
+class Sample:
+    rows: pd.DataFrame
+    # Rows in the population and in the sample, indexed by stratum id
+    population: np.ndarray
+    sampled: np.ndarray
+
+
+def build_sample(df, fraction=SAMPLE_FRACTION, min_per_stratum=MIN_PER_STRATUM, seed=0):
+    strata = df.groupby(STRATA, observed=True).ngroup().to_numpy()
+    population = np.bincount(strata)
+    sampled = np.minimum(
+        population, np.maximum(np.ceil(population * fraction), min_per_stratum)
+    ).astype(np.int64)
+
+    # Shuffle, then keep the first `sampled` rows of each stratum
+    order = np.random.default_rng(seed).permutation(len(df))
+    by_stratum = np.argsort(strata[order], kind="stable")
+    positions = order[by_stratum]
+    sorted_strata = strata[positions]
+    rank = np.arange(len(df)) - np.searchsorted(sorted_strata, sorted_strata)
+    keep = rank < sampled[sorted_strata]
+
+    rows = df.iloc[positions[keep]][SAMPLE_COLUMNS].reset_index(drop=True)
+    rows["stratum"] = sorted_strata[keep]
+    return Sample(rows, population, sampled)
+
+
+def _combine(samples):
+    # Partitions are sampled separately, so their strata get distinct ids
+    offsets = np.cumsum([0] + [len(s.population) for s in samples[:-1]])
+    rows = engine.concat_frames(
+        [s.rows.assign(stratum=s.rows["stratum"] + o) for s, o in zip(samples, offsets)]
+    )
+    return Sample(
+        rows,
+        np.concatenate([s.population for s in samples]),
+        np.concatenate([s.sampled for s in samples]),
+    )
+
+
+@engine.memoized(maxsize=4)
+def sales_sample(file_path=engine.DATA_FILE):
+    # Built once per dataset; partitioned data is sampled one month at a time
+    if engine.is_partitioned(file_path):
+        return _combine(
+            [
+                build_sample(engine.load_partition(file_path, month))
+                for month in engine.partitions_for(file_path)
+            ]
+        )
+    return build_sample(engine.load_data(file_path))
+
+
+def _estimate_totals(sample, rows, value, by=None):
+    # Horvitz-Thompson totals for the filtered rows and the variance of each
+    # total under stratified simple random sampling, summed over strata
+    keys = ["stratum"] + (by or [])
+    sums = (
+        rows.assign(_value=rows[value], _square=rows[value] ** 2)
+        .groupby(keys, observed=True)
+        .agg(s1=("_value", "sum"), s2=("_square", "sum"))
+    )
+    stratum = sums.index.get_level_values("stratum").to_numpy()
+    N = sample.population[stratum].astype(float)
+    n = sample.sampled[stratum].astype(float)
+    s1, s2 = sums["s1"].to_numpy(), sums["s2"].to_numpy()
+
+    total = N / n * s1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        within = np.where(n > 1, (s2 - s1**2 / n) / (n - 1), 0.0)
+    variance = N**2 * (1 - n / N) * within / n
+
+    estimates = pd.DataFrame({"total": total, "variance": variance}, index=sums.index)
+    if by:
+        return estimates.groupby(level=by, observed=True).sum()
+    return estimates.sum()
+
+
+def _error(variance):
+    return Z_95 * np.sqrt(np.maximum(variance, 0))
+
+
+def _sample_rows(filters, file_path):
+    sample = sales_sample(file_path)
+    return sample, sample.rows[engine.filter_mask(sample.rows, filters)]
+
+
+@engine.memoized(maxsize=256)
+def kpis_estimate(filters, file_path=engine.DATA_FILE):
+    # Returns (metrics, errors) shaped like engine.kpis(); errors are 95%
+    # half-widths
+    sample, rows = _sample_rows(filters, file_path)
+    if rows.empty:
+        metrics = {"total_sales": 0.0, "total_margin": 0.0, "avg_margin_pct": 0.0}
+        return metrics, dict.fromkeys(metrics, 0.0), 0
+
+    sales = _estimate_totals(sample, rows, "Total Sales")
+    margin = _estimate_totals(sample, rows, "Margin")
+    count = _estimate_totals(sample, rows.assign(_one=1.0), "_one")
+
+    # Average Margin % is a ratio of two estimated totals; its variance comes
+    # from the linearized residuals (y - R) / N
+    margin_pct_total = _estimate_totals(sample, rows, "Margin %")
+    ratio = margin_pct_total["total"] / count["total"]
+    residual = _estimate_totals(
+        sample, rows.assign(_residual=rows["Margin %"] - ratio), "_residual"
+    )
+
+    metrics = {
+        "total_sales": float(sales["total"]),
+        "total_margin": float(margin["total"]),
+        "avg_margin_pct": float(ratio),
+    }
+    errors = {
+        "total_sales": float(_error(sales["variance"])),
+        "total_margin": float(_error(margin["variance"])),
+        "avg_margin_pct": float(_error(residual["variance"]) / count["total"]),
+    }
+    return metrics, errors, int(round(count["total"]))
+
+
+def _grouped_estimate(sample, rows, by):
+    estimates = _estimate_totals(sample, rows, "Total Sales", by)
+    return pd.DataFrame(
+        {
+            "Total Sales": estimates["total"],
+            "Error": _error(estimates["variance"]),
+        },
+        index=estimates.index,
+    ).reset_index()
+
+
+@engine.memoized(maxsize=256)
+def sales_by_estimate(column, filters, file_path=engine.DATA_FILE):
+    sample, rows = _sample_rows(filters, file_path)
+    return _grouped_estimate(sample, rows, [column])
+
+
+@engine.memoized(maxsize=256)
+def sales_over_time_estimate(filters, file_path=engine.DATA_FILE):
+    sample, rows = _sample_rows(filters, file_path)
+    return _grouped_estimate(sample, rows, ["Date"])
+
+
+@engine.memoized(maxsize=256)
+def sales_by_period_estimate(column, filters, freq="D", file_path=engine.DATA_FILE):
+    sample, rows = _sample_rows(filters, file_path)
+    if freq == "D":
+        rows = rows.assign(Period=rows["Date"])
+    else:
+        rows = rows.assign(Period=rows["Date"].dt.to_period(freq).dt.to_timestamp())
+    return _grouped_estimate(sample, rows, [column, "Period"]).sort_values("Period")
@@ -0,0 +1,136 @@
+import os
+import random
+
+import pandas as pd
+import pytest
+
+import customers
+import deltas
+import engine
+from generatedata import generate_data
+
+
+def ingest(df, out_dir):
+    # What ingest.py does with already parsed rows
+    manifest = engine.write_partitions(df, out_dir, merge=True)
+    customers.update_store(out_dir, df, manifest)
+
+
+def read_csv(file_path):
+    return engine.compact(engine.parse_sales(pd.read_csv(file_path)))
+
+
+def month_frames(out_dir, path_for):
+    manifest = engine.load_manifest(out_dir)
+    return {
+        month: pd.read_parquet(path_for(out_dir, month))
+        for month in sorted(manifest["partitions"])
+    }
+
+
+def comparable(df, keys):
+    columns = [column for column in engine.CATEGORY_COLUMNS if column in df]
+    return df.astype({column: str for column in columns}).sort_values(
+        keys, ignore_index=True
+    )
+
+
+def assert_same_store(out_dir, expected_dir):
+    assert engine.load_manifest(out_dir) == engine.load_manifest(expected_dir)
+    for path_for, keys in [
+        (engine.partition_path, ["Order ID"]),
+        (engine.cube_path, engine.CUBE_KEYS),
+    ]:
+        frames = month_frames(out_dir, path_for)
+        expected = month_frames(expected_dir, path_for)
+        assert frames.keys() == expected.keys()
+        for month in frames:
+            pd.testing.assert_frame_equal(
+                comparable(frames[month], keys),
+                comparable(expected[month], keys),
+                check_exact=False,
+            )
+    table, months = customers._read_store(out_dir)
+    expected_table, expected_months = customers._read_store(expected_dir)
+    pd.testing.assert_frame_equal(
+        comparable(table, ["Customer Name"]),
+        comparable(expected_table, ["Customer Name"]),
+        check_exact=False,
+    )
+    pd.testing.assert_frame_equal(
+        comparable(months, ["Customer Name", "Month"]),
+        comparable(expected_months, ["Customer Name", "Month"]),
+    )
+
+
+@pytest.fixture
+def store(sales_csv, tmp_path):
+    out_dir = str(tmp_path / "store")
+    ingest(read_csv(sales_csv), out_dir)
+    return out_dir
+
+
+def test_apply_deltas_matches_fresh_ingest(sales_csv, store, tmp_path):
+    original = pd.read_csv(sales_csv)
+    rng = random.Random(1)
+    picked = rng.sample(range(len(original)), 60)
+
+    # Updates change amounts, segments and dates, moving some orders into
+    # other months and some past the last partition
+    updates = original.iloc[picked[:30]].copy()
+    updates["Units Sold"] += 1
+    updates["Total Sales"] = (updates["Total Sales"] * 1.1).round(2)
+    updates["Customer Segment"] = "Corporate"
+    updates["Date"] = (
+        pd.to_datetime(updates["Date"]) + pd.Timedelta(days=40)
+    ).dt.strftime("%Y-%m-%d")
+    random.seed(2)
+    generate_data(str(tmp_path / "inserts.csv"), 20, order_id_start=900_001)
+    inserts = pd.read_csv(tmp_path / "inserts.csv")
+    inserts.loc[0, "State"] = "ZZ"
+    deleted = original["Order ID"].iloc[picked[30:]]
+
+    delta_file = tmp_path / "deltas.csv"
+    pd.concat(
+        [
+            updates.assign(Op="update"),
+            inserts.assign(Op="insert"),
+            pd.DataFrame({"Order ID": deleted, "Op": "delete"}),
+            pd.DataFrame({"Order ID": ["ORD-999999999"], "Op": "delete"}),
+        ]
+    ).to_csv(delta_file, index=False)
+
+    upserts, deletes = deltas.read_deltas(delta_file)
+    report = deltas.apply_deltas(store, upserts, deletes)
+    assert (report["inserted"], report["updated"]) == (20, 30)
+    assert (report["deleted"], report["missing"]) == (30, 1)
+
+    final = original[~original["Order ID"].isin(updates["Order ID"])]
+    final = final[~final["Order ID"].isin(deleted)]
+    expected_csv = tmp_path / "final.csv"
+    pd.concat([final, updates, inserts]).to_csv(expected_csv, index=False)
+    expected_dir = str(tmp_path / "expected")
+    ingest(read_csv(expected_csv), expected_dir)
+
+    assert_same_store(store, expected_dir)
+    assert os.path.exists(os.path.join(store, engine.ORDER_INDEX_FILE))
+
+
+def test_deletes_only_and_reapplied(sales_csv, store, tmp_path):
+    original = pd.read_csv(sales_csv)
+    deleted = original["Order ID"].iloc[::100]
+    delta_file = tmp_path / "deletes.csv"
+    pd.DataFrame({"Order ID": deleted, "Op": "delete"}).to_csv(delta_file, index=False)
+
+    report = deltas.apply_deltas(store, *deltas.read_deltas(delta_file))
+    assert (report["deleted"], report["missing"]) == (len(deleted), 0)
+    # Applied again, every order is already gone and nothing is rewritten
+    report = deltas.apply_deltas(store, *deltas.read_deltas(delta_file))
+    assert (report["deleted"], report["missing"]) == (0, len(deleted))
+    assert report["months"] == []
+
+    expected_csv = tmp_path / "final.csv"
+    original[~original["Order ID"].isin(deleted)].to_csv(expected_csv, index=False)
+    expected_dir = str(tmp_path / "expected")
+    ingest(read_csv(expected_csv), expected_dir)
+    assert_same_store(store, expected_dir)
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from concurrent import futures
+
+import pandas as pd
+
+import engine
+import planner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_memoized_concurrent_calls_build_once():
+    calls = []
+
+    @engine.memoized(maxsize=4)
+    def build(value, scale=2):
+        calls.append(value)
+        time.sleep(0.1)
+        return value * scale
+
+    with futures.ThreadPoolExecutor(max_workers=8) as pool:
+        first = [pool.submit(build, 1) for _ in range(4)]
+        first += [pool.submit(build, 1, scale=2) for _ in range(4)]
+        other = pool.submit(build, 2)
+    assert [job.result() for job in first] == [2] * 8
+    assert other.result() == 4
+    assert sorted(calls) == [1, 2]
+
+
+def test_memoized_concurrent_failure_retries():
+    calls = []
+    release = threading.Event()
+
+    @engine.memoized(maxsize=4)
+    def build(value):
+        calls.append(value)
+        release.wait(1)
+        if len(calls) == 1:
+            raise ValueError("first build fails")
+        return value
+
+    with futures.ThreadPoolExecutor(max_workers=2) as pool:
+        jobs = [pool.submit(build, 1) for _ in range(2)]
+        time.sleep(0.05)
+        release.set()
+    # The waiter isn't handed the failure; it builds again
+    errors = [job.exception() for job in jobs]
+    assert sum(isinstance(error, ValueError) for error in errors) == 1
+    assert calls == [1, 1]
+
+
+def test_cold_cube_and_prefix_sums_build_once(sales_partitions):
+    engine.clear_caches()
+    planner.prefix_sums.cache_clear()
+    barrier = threading.Barrier(6)
+
+    def plan():
+        barrier.wait()
+        return planner.execute(
+            planner.Query((), engine.make_filters(), "D"), sales_partitions
+        )
+
+    with futures.ThreadPoolExecutor(max_workers=6) as pool:
+        results = [pool.submit(plan) for _ in range(6)]
+    assert len({result.result()["total_sales"] for result in results}) == 1
+    assert engine.daily_cube.cache_info().misses == 1
+    assert planner.prefix_sums.cache_info().misses == 1
+
+
+def test_later_file_without_coordinates_keeps_them(tmp_path):
+    original = pd.read_csv(os.path.join(ROOT, "dummy_sales_data.csv")).head(200)
+    coordinates = ["City_State", "Latitude", "Longitude"]
+    # A later extract without coordinates re-sends half the orders with new
+    # amounts and adds orders of its own
+    added = original.head(10).assign(**{"Order ID": [f"ORD-{n}" for n in range(10)]})
+    resent = pd.concat([original.head(100), added]).drop(columns=coordinates)
+    resent["Total Sales"] += 1
+    original.to_csv(tmp_path / "a.csv", index=False)
+    resent.to_csv(tmp_path / "b.csv", index=False)
+
+    df, _ = engine.read_sources(engine.source_files(str(tmp_path / "*.csv")))
+    df = df.set_index("Order ID")
+    first = engine.read_sales(str(tmp_path / "a.csv")).set_index("Order ID")
+    assert len(df) == 210
+    ids = first.index
+    assert (df.loc[ids[:100], "Total Sales"] == first["Total Sales"][:100] + 1).all()
+    assert (df.loc[ids[100:], "Total Sales"] == first["Total Sales"][100:]).all()
+    for column in coordinates:
+        assert df.loc[ids, column].equals(first[column])
+    assert df.loc[range(10), "Latitude"].isna().all()
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+import jobs
+
+calls = []
+
+
+def work(name, started, finish):
+    calls.append(name)
+    started.set()
+    finish.wait(5)
+    return name
+
+
+@pytest.fixture
+def finish():
+    calls.clear()
+    finish = threading.Event()
+    yield finish
+    finish.set()
+
+
+def busy_pool(finish):
+    # Occupy every worker so the next job queues
+    batch = jobs.Batch()
+    for n in range(jobs.MAX_WORKERS):
+        started = threading.Event()
+        batch.submit(work, f"busy{n}", started, finish)
+        assert started.wait(5)
+    return batch
+
+
+def test_identical_jobs_share_one_run(finish):
+    started = threading.Event()
+    with jobs.Batch() as first, jobs.Batch() as second:
+        job = first.submit(work, "query", started, finish)
+        assert second.submit(work, "query", started, finish) is job
+        finish.set()
+        assert job.result()[0] == "query"
+    assert calls == ["query"]
+
+
+def test_release_cancels_queued_job(finish):
+    busy = busy_pool(finish)
+    batch = jobs.Batch()
+    args = ("queued", threading.Event(), finish)
+    job = batch.submit(work, *args)
+    batch.release()
+    assert job.cancelled()
+    assert (work, args) not in jobs._jobs
+    finish.set()
+    busy.release()
+    assert "queued" not in calls
+
+
+def test_release_keeps_queued_job_another_rerun_waits_for(finish):
+    busy = busy_pool(finish)
+    started = threading.Event()
+    with jobs.Batch() as other:
+        batch = jobs.Batch()
+        job = batch.submit(work, "queued", started, finish)
+        assert other.submit(work, "queued", started, finish) is job
+        batch.release()
+        assert not job.cancelled()
+        finish.set()
+        assert job.result()[0] == "queued"
+    busy.release()
+
+
+def test_running_job_is_shared_after_release(finish):
+    started = threading.Event()
+    batch = jobs.Batch()
+    args = ("running", started, finish)
+    job = batch.submit(work, *args)
+    assert started.wait(5)
+    # An interrupted rerun leaves the running job for the next one to share
+    batch.release()
+    assert jobs._jobs.get((work, args)) is job
+    with jobs.Batch() as rerun:
+        assert rerun.submit(work, "running", started, finish) is job
+        finish.set()
+        assert job.result()[0] == "running"
+    assert calls == ["running"]
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+import planner
+
+QUERIES = [
+    ((), "D"),
+    (("Date",), "D"),
+    (("Product Category",), "D"),
+    (("Product Sub-Category",), "D"),
+    (("State",), "D"),
+    (("Customer Segment",), "D"),
+    (("Product Category", "Period"), "D"),
+    (("Product Category", "Period"), "M"),
+    (("Customer Segment", "Period"), "Q"),
+]
+
+FILTERS = [
+    {},
+    {"start_date": "2024-03-05", "end_date": "2024-07-19"},
+    {"categories": ["Technology"]},
+    {"segments": ["Consumer", "Corporate"], "states": ["CA", "NY", "TX"]},
+    {
+        "start_date": "2024-02-01",
+        "end_date": "2024-02-29",
+        "categories": ["Furniture", "Office Supplies"],
+        "states": ["CA", "FL"],
+    },
+    {"start_date": "2024-06-30", "end_date": "2024-06-30", "segments": ["Consumer"]},
+    {"states": []},
+    {"start_date": "2030-01-01"},
+]
+
+
+def assert_same(result, expected):
+    # Margin % is stored as float32, and the scan averages it at that
+    # precision while the cube sums it as float64
+    if isinstance(expected, dict):
+        assert result == pytest.approx(expected, rel=1e-6)
+        return
+    keys = [column for column in expected.columns if column != "Total Sales"]
+    result, expected = (
+        df.astype({column: str for column in keys})
+        .sort_values(keys)
+        .reset_index(drop=True)
+        for df in (result, expected)
+    )
+    pd.testing.assert_frame_equal(result[keys], expected[keys])
+    np.testing.assert_allclose(result["Total Sales"], expected["Total Sales"])
+
+
+@pytest.fixture(params=["csv", "partitioned"])
+def file_path(request, sales_csv, sales_partitions):
+    return sales_csv if request.param == "csv" else sales_partitions
+
+
+@pytest.mark.parametrize("group_by,freq", QUERIES)
+@pytest.mark.parametrize("kwargs", FILTERS)
+def test_sources_match_scan(monkeypatch, file_path, group_by, freq, kwargs):
+    # Each source is forced in turn; sources that can't answer the query,
+    # such as bitmaps on partitioned data, fall back to the scan
+    query = planner.Query(group_by, engine.make_filters(**kwargs), freq)
+    monkeypatch.setattr(planner, "ENABLED_SOURCES", ["scan"])
+    expected = planner.execute(query, file_path)
+
+    for source in ["prefix", "cube", "bitmap"]:
+        monkeypatch.setattr(planner, "ENABLED_SOURCES", [source])
+        result = planner.execute(query, file_path)
+        if planner.recent_plans(1)[0]["source"] == source:
+            assert_same(result, expected)
+
+
+@pytest.mark.parametrize(
+    "group_by,kwargs,source",
+    [
+        ((), {}, "prefix"),
+        (("State",), {"categories": ["Technology"]}, "prefix"),
+        (("Product Category", "Period"), {}, "cube"),
+        (("Product Sub-Category",), {"states": ["CA"]}, "bitmap"),
+        (("Product Sub-Category",), {}, "scan"),
+    ],
+)
+def test_plan_picks_source(sales_csv, group_by, kwargs, source):
+    query = planner.Query(group_by, engine.make_filters(**kwargs))
+    assert planner.plan(query, sales_csv)[0] == source
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+import engine
+
+# A day is flagged when its sales are Z_THRESHOLD standard deviations away
+# from the BASELINE_DAYS before it. Days with less than MIN_HISTORY_DAYS of
+# history are never flagged.
+BASELINE_DAYS = 28
+MIN_HISTORY_DAYS = 14
+Z_THRESHOLD = 3.0
+WEEK_DAYS = 7
+MONTH_DAYS = 30
+ALL = "All"
+
+
+def rolling_stats(values):
+    # values is a (series x days) array of daily sales with no missing days.
+    # Every statistic is computed for all series at once from running sums.
+    values = np.asarray(values, dtype="float64")
+    series, days = values.shape
+    day = np.arange(days)
+
+    # Centering each series keeps the running sums of squares small
+    centered = values - values.mean(axis=1, keepdims=True)
+    sums = np.zeros((series, days + 1))
+    squares = np.zeros((series, days + 1))
+    np.cumsum(centered, axis=1, out=sums[:, 1:])
+    np.cumsum(centered**2, axis=1, out=squares[:, 1:])
+
+    # Baseline: the BASELINE_DAYS before each day, not including it
+    start = np.maximum(day - BASELINE_DAYS, 0)
+    n = day - start
+    s1 = sums[:, day] - sums[:, start]
+    s2 = squares[:, day] - squares[:, start]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s1 / n
+        std = np.sqrt(np.maximum((s2 - s1**2 / n) / (n - 1), 0))
+        z = (centered - mean) / std
+    z[:, n < MIN_HISTORY_DAYS] = np.nan
+    z[~np.isfinite(z)] = np.nan
+
+    raw_sums = np.zeros((series, days + 1))
+    np.cumsum(values, axis=1, out=raw_sums[:, 1:])
+
+    def change(window):
+        # Sum over the `window` days ending on each day against the window
+        # before it
+        end = day + 1
+        current = raw_sums[:, end] - raw_sums[:, np.maximum(end - window, 0)]
+        previous = (
+            raw_sums[:, np.maximum(end - window, 0)]
+            - raw_sums[:, np.maximum(end - 2 * window, 0)]
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = (current / previous - 1) * 100
+        pct[:, end < 2 * window] = np.nan
+        pct[~np.isfinite(pct)] = np.nan
+        return pct
+
+    return {
+        "Rolling Mean": mean + values.mean(axis=1, keepdims=True),
+        "Rolling Std": std,
+        "Z-Score": z,
+        "WoW %": change(WEEK_DAYS),
+        "MoM %": change(MONTH_DAYS),
+    }
+
+
+def flag_series(df, keys, date_column="Date", value_column="Total Sales"):
+    # Rolling statistics for each series in a long frame (one row per key and
+    # date). Missing days count as zero sales. Returns one row per series and
+    # day with an "Anomaly" column.
+    keys = list(keys)
+    if keys:
+        matrix = df.pivot_table(
+            index=keys,
+            columns=date_column,
+            values=value_column,
+            aggfunc="sum",
+            fill_value=0,
+            observed=True,
+        )
+    else:
+        matrix = df.groupby(date_column)[value_column].sum().to_frame().T
+    if matrix.empty:
+        return pd.DataFrame(columns=keys + [date_column, value_column, "Anomaly"])
+    dates = pd.date_range(matrix.columns.min(), matrix.columns.max(), freq="D")
+    matrix = matrix.reindex(columns=dates, fill_value=0)
+
+    stats = rolling_stats(matrix.to_numpy())
+    result = pd.DataFrame(
+        {date_column: np.tile(dates, len(matrix))}
+        | {value_column: matrix.to_numpy().ravel()}
+        | {name: values.ravel() for name, values in stats.items()}
+    )
+    for position, key in enumerate(keys):
+        labels = (
+            matrix.index.get_level_values(position) if len(keys) > 1 else matrix.index
+        )
+        result.insert(position, key, np.repeat(labels.to_numpy(), len(dates)))
+    result["Anomaly"] = result["Z-Score"].abs() >= Z_THRESHOLD
+    return result
+
+
+@engine.memoized(maxsize=4)
+def trend_table(file_path=engine.DATA_FILE):
+    # Rolling statistics for every State x Product Category series, plus the
+    # per-category, per-state and overall totals (labelled "All"), computed
+    # once per dataset from the daily cube
+    daily = (
+        engine.daily_cube(file_path)
+        .groupby(["State", "Product Category", "Date"], observed=True)["Total Sales"]
+        .sum()
+        .reset_index()
+    )
+    levels = pd.concat(
+        [
+            daily,
+            daily.assign(State=ALL),
+            daily.assign(**{"Product Category": ALL}),
+            daily.assign(State=ALL, **{"Product Category": ALL}),
+        ],
+        ignore_index=True,
+    ).astype({"State": "category", "Product Category": "category"})
+    return flag_series(levels, ["State", "Product Category"])
+
+
+@engine.memoized(maxsize=256)
+def anomalies(filters, file_path=engine.DATA_FILE):
+    # Flagged days within the filtered date range, for the filtered states and
+    # categories or their totals. Segments are not split out.
+    table = trend_table(file_path)
+    mask = table["Anomaly"].to_numpy(copy=True)
+    if filters.start_date is not None:
+        mask &= (table["Date"] >= filters.start_date).to_numpy()
+    if filters.end_date is not None:
+        mask &= (table["Date"] <= filters.end_date).to_numpy()
+    for column, values in [
+        ("Product Category", filters.categories),
+        ("State", filters.states),
+    ]:
+        if values is not None:
+            mask &= table[column].isin(list(values) + [ALL]).to_numpy()
+    return (
+        table[mask]
+        .sort_values("Z-Score", key=np.abs, ascending=False)
+        .reset_index(drop=True)
+    )
+
+
+def render_anomaly_table(filters, file_path=engine.DATA_FILE):
+    # Expander listing the flagged days behind a page's filters
+    import streamlit as st
+
+    flagged = anomalies(filters, file_path)
+    with st.expander(f"🚨 Sales anomalies ({len(flagged)})"):
+        st.caption(
+            f"Days where a series' sales were {Z_THRESHOLD:g} or more standard "
+            f"deviations from its previous {BASELINE_DAYS} days, across all "
+            'customer segments. "All" rows are totals over states or categories.'
+        )
+        st.dataframe(
+            flagged[
+                [
+                    "Date",
+                    "State",
+                    "Product Category",
+                    "Total Sales",
+                    "Rolling Mean",
+                    "Z-Score",
+                    "WoW %",
+                    "MoM %",
+                ]
+            ],
+            hide_index=True,
+            column_config={
+                "Date": st.column_config.DateColumn(format="YYYY-MM-DD"),
+                "Total Sales": st.column_config.NumberColumn(format="$%.2f"),
+                "Rolling Mean": st.column_config.NumberColumn(format="$%.2f"),
+                "Z-Score": st.column_config.NumberColumn(format="%.2f"),
+                "WoW %": st.column_config.NumberColumn(format="%.1f%%"),
+                "MoM %": st.column_config.NumberColumn(format="%.1f%%"),
+            },
+        )
+    return flagged
@@ -0,0 +1,189 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import customers
+import engine
+import metrics_api
+import sampling
+import trends
+
+# Set DASHBOARD_WARMUP=0 to disable warming. Popular filter combinations are
+# read from DASHBOARD_WARMUP_FILE, a JSON list of metrics API batch queries.
+ENV_FLAG = "DASHBOARD_WARMUP"
+ENV_FILE = "DASHBOARD_WARMUP_FILE"
+DEFAULT_QUERIES_FILE = "warmup_queries.json"
+
+_status = {
+    "state": "idle",
+    "total": 0,
+    "done": 0,
+    "errors": 0,
+    "started_at": None,
+    "finished_at": None,
+}
+_status_lock = threading.Lock()
+_thread = None
+
+logger = logging.getLogger(__name__)
+
+
+def default_views(file_path=engine.DATA_FILE):
+    # The filters each page builds on a fresh load, with every option selected.
+    # These must match the pages exactly or the warmed entries won't be hit.
+    start_date, end_date = engine.date_bounds(file_path)
+    categories = engine.dimension_values("Product Category", file_path)
+    segments = engine.dimension_values("Customer Segment", file_path)
+    states = engine.dimension_values("State", file_path)
+
+    home = engine.make_filters(
+        start_date, end_date, categories=categories, segments=segments
+    )
+    by_category = engine.make_filters(
+        start_date, end_date, segments=segments, states=states
+    )
+    state_map = engine.make_filters(start_date, end_date, categories=categories)
+
+    return [
+        ("top_customers.sales", engine.top_orders, ("Total Sales", 5, file_path)),
+        ("top_customers.margin", engine.top_orders, ("Margin", 5, file_path)),
+        ("home.kpis", engine.kpis, (home, file_path)),
+        ("home.sales_over_time", engine.sales_over_time, (home, file_path)),
+        ("home.by_category", engine.sales_by, ("Product Category", home, file_path)),
+        ("home.by_state", engine.sales_by, ("State", home, file_path)),
+        ("home.by_segment", engine.sales_by, ("Customer Segment", home, file_path)),
+        (
+            "top_performers.products",
+            engine.sales_by,
+            ("Product Sub-Category", home, file_path),
+        ),
+        *[
+            (
+                f"sales_by_category.{freq}",
+                engine.sales_by_period,
+                ("Product Category", by_category, freq, file_path),
+            )
+            for freq in engine.FREQUENCIES.values()
+        ],
+        ("map.by_state", engine.sales_by, ("State", state_map, file_path)),
+        # Fast preview mode answers from this sample
+        ("fast_preview.sample", sampling.sales_sample, (file_path,)),
+        ("anomalies.trend_table", trends.trend_table, (file_path,)),
+        # Top Customers builds the same filters over first order dates
+        (
+            "top_customers.cohorts",
+            customers.cohort_retention,
+            (by_category, None, file_path),
+        ),
+    ]
+
+
+def popular_views(queries_file, file_path=engine.DATA_FILE):
+    if not queries_file or not os.path.exists(queries_file):
+        return []
+    with open(queries_file) as f:
+        queries = json.load(f)
+
+    views = []
+    for n, query in enumerate(queries):
+        # Checked like a batch API entry, so a malformed one is skipped rather
+        # than failing the whole warm-up
+        try:
+            metric, filters, freq = metrics_api.parse_batch_query(query)
+        except metrics_api.QueryError as e:
+            logger.warning("Skipping warm-up query %d: %s", n, e)
+            continue
+        views.append(
+            (
+                query.get("name", f"popular.{n}"),
+                metrics_api.run_query,
+                (metric, filters, freq, file_path),
+            )
+        )
+    return views
+
+
+def _update(**changes):
+    with _status_lock:
+        _status.update(changes)
+
+
+def status():
+    with _status_lock:
+        current = dict(_status)
+    if current["started_at"] is not None:
+        end = current["finished_at"] or time.time()
+        current["elapsed_s"] = end - current["started_at"]
+    return current
+
+
+def run_warmup(file_path=engine.DATA_FILE, queries_file=None, max_workers=4):
+    _update(state="running", started_at=time.time(), finished_at=None)
+
+    # Every view needs the parsed data (or the partition manifest), so load it
+    # before fanning out
+    try:
+        engine.dataset_rows(file_path)
+        views = default_views(file_path) + popular_views(queries_file, file_path)
+    except Exception as e:
+        logger.error("Cache warm-up failed: %s", e)
+        _update(state="failed", finished_at=time.time())
+        return status()
+    _update(total=len(views), done=0, errors=0)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fn, *args): name for name, fn, args in views}
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                logger.error(
+                    "Warm-up of %s failed: %s", futures[future], future.exception()
+                )
+                with _status_lock:
+                    _status["errors"] += 1
+            with _status_lock:
+                _status["done"] += 1
+
+    _update(state="done", finished_at=time.time())
+    result = status()
+    logger.info(
+        "Cache warm-up finished: %d views (%d errors) in %.2fs",
+        result["done"],
+        result["errors"],
+        result["elapsed_s"],
+    )
+    return result
+
+
+def start_background_warmup(file_path=engine.DATA_FILE, max_workers=4):
+    # Start warming once per process on a daemon thread; later calls are no-ops
+    global _thread
+    if os.environ.get(ENV_FLAG) == "0":
+        return
+    with _status_lock:
+        if _thread is not None:
+            return
+        queries_file = os.environ.get(ENV_FILE, DEFAULT_QUERIES_FILE)
+        _thread = threading.Thread(
+            target=run_warmup,
+            args=(file_path, queries_file, max_workers),
+            name="cache-warmup",
+            daemon=True,
+        )
+        _thread.start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute the default and popular views and report timing."
+    )
+    parser.add_argument("--data", default=engine.DATA_FILE)
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_FILE)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    print(json.dumps(run_warmup(args.data, args.queries, args.workers), indent=2))